@@ -0,0 +1,422 @@
+"""
+Archive Scrubber Module
+Incremental, resumable integrity check of stored documents against the recorded hashes
+"""
+import os
+import sys
+import mmap
+import time
+import sqlite3
+import hashlib
+import logging
+import argparse
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterator, List, Optional, Set, Tuple
+
+from cold_storage import ColdStorage
+from document_catalog import DocumentCatalog
+
+logger = logging.getLogger(__name__)
+
+# Bytes passed to sha256.update() per call; large slices let hashlib release the GIL
+HASH_CHUNK_SIZE = 8 * 1024 * 1024
+
+
+def lower_priority():
+    """
+    Run the current process at idle CPU and I/O priority so live ingestion is not slowed
+    Linux: SCHED_IDLE (which also selects the idle I/O class), other POSIX: nice 19,
+    Windows: background processing mode
+    """
+    try:
+        if hasattr(os, 'sched_setscheduler'):
+            os.sched_setscheduler(0, os.SCHED_IDLE, os.sched_param(0))
+        elif hasattr(os, 'nice'):
+            os.nice(19)
+        elif os.name == 'nt':
+            import ctypes
+            process_mode_background_begin = 0x00100000
+            kernel32 = ctypes.windll.kernel32
+            kernel32.SetPriorityClass(kernel32.GetCurrentProcess(), process_mode_background_begin)
+    except Exception as e:
+        logger.debug(f"Could not lower process priority: {e}")
+
+
+def hash_file(path: str) -> Tuple[str, Optional[str], Optional[str]]:
+    """
+    Hash a file through a read-only memory map (runs in a worker process)
+
+    Args:
+        path: File path
+
+    Returns:
+        Tuple of (path, sha256 or None, error message or None)
+    """
+    try:
+        sha256 = hashlib.sha256()
+        with open(path, 'rb') as f:
+            # mmap cannot map empty files
+            if os.fstat(f.fileno()).st_size:
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                    view = memoryview(mapped)
+                    try:
+                        for offset in range(0, len(view), HASH_CHUNK_SIZE):
+                            sha256.update(view[offset:offset + HASH_CHUNK_SIZE])
+                    finally:
+                        view.release()
+        return path, sha256.hexdigest(), None
+    except Exception as e:
+        return path, None, str(e)
+
+
+class ArchiveScrubber:
+    """
+    Verifies stored documents against the catalog and the processed-hash list
+
+    Hash results are kept in a state database. Files whose size and mtime are unchanged
+    since they were last verified are not read again until they are older than the
+    re-verify interval. An interrupted pass is resumed where it stopped.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS scrubbed_files (
+            path TEXT PRIMARY KEY,
+            size INTEGER NOT NULL,
+            mtime_ns INTEGER NOT NULL,
+            sha256 TEXT,
+            status TEXT NOT NULL,
+            scrubbed_at REAL NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS passes (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            started_at REAL NOT NULL,
+            finished_at REAL,
+            full INTEGER NOT NULL
+        );
+    """
+
+    def __init__(self, document_folders: Dict[str, Path], state_db: Path,
+                 catalog: Optional[DocumentCatalog] = None,
+                 processed_hashes: Optional[Set[str]] = None,
+                 workers: int = 2,
+                 cold_storage: Optional[ColdStorage] = None):
+        """
+        Initialize archive scrubber
+
+        Args:
+            document_folders: Dictionary mapping folder names to Path objects
+            state_db: Path to the scrub state database
+            catalog: Optional catalog holding the expected hash per path
+            processed_hashes: Hashes recorded by the attachment handler
+            workers: Number of hashing processes
+            cold_storage: Optional pack index; packed documents are not reported missing
+        """
+        self.document_folders = document_folders
+        self.cold_storage = cold_storage
+        self.catalog = catalog
+        self.processed_hashes = processed_hashes or set()
+        self.workers = max(1, workers)
+        self.connection = sqlite3.connect(str(state_db))
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.executescript(self.SCHEMA)
+        self.connection.commit()
+
+    def close(self):
+        """Close the state database"""
+        try:
+            self.connection.close()
+        except Exception as e:
+            logger.warning(f"Error closing scrub state: {e}")
+
+    def _start_pass(self, full: bool) -> Tuple[int, float]:
+        """
+        Resume the last unfinished pass of the same kind, or start a new one
+
+        Args:
+            full: Whether every file is re-hashed
+
+        Returns:
+            Tuple of (pass id, start time)
+        """
+        row = self.connection.execute(
+            'SELECT id, started_at, full FROM passes ORDER BY id DESC LIMIT 1'
+        ).fetchone()
+        if row and bool(row[2]) == full and self._is_unfinished(row[0]):
+            logger.info(f"Resuming scrub pass {row[0]}")
+            return row[0], row[1]
+
+        started_at = time.time()
+        cursor = self.connection.execute(
+            'INSERT INTO passes (started_at, full) VALUES (?, ?)', (started_at, int(full))
+        )
+        self.connection.commit()
+        return cursor.lastrowid, started_at
+
+    def _is_unfinished(self, pass_id: int) -> bool:
+        """Check whether a pass was interrupted"""
+        row = self.connection.execute('SELECT finished_at FROM passes WHERE id = ?', (pass_id,)).fetchone()
+        return row is not None and row[0] is None
+
+    def _iter_files(self, min_age_seconds: float) -> Iterator[Tuple[Path, os.stat_result]]:
+        """
+        Walk the document folders
+
+        Args:
+            min_age_seconds: Skip files modified more recently (may still be written)
+
+        Yields:
+            Tuples of (file_path, stat_result)
+        """
+        cutoff = time.time() - min_age_seconds
+        for folder in self.document_folders.values():
+            if not folder.exists():
+                continue
+            for directory, dirnames, filenames in os.walk(folder):
+                dirnames[:] = [name for name in dirnames if not name.startswith('.')]
+                for filename in filenames:
+                    if filename.startswith('.'):
+                        continue
+                    file_path = Path(directory) / filename
+                    try:
+                        stat = file_path.stat()
+                    except FileNotFoundError:
+                        continue
+                    if stat.st_mtime <= cutoff:
+                        yield file_path, stat
+
+    def _classify(self, file_path: Path, file_hash: str, previous: Optional[tuple], unchanged: bool) -> str:
+        """
+        Compare a file's hash with the recorded hashes
+
+        Args:
+            file_path: Path of the file
+            file_hash: Current SHA256 hash
+            previous: Previous state row (size, mtime_ns, sha256, status, scrubbed_at), if any
+            unchanged: Whether size and mtime match the previous row
+
+        Returns:
+            'ok', 'corrupted' or 'untracked'
+        """
+        record = self.catalog.get_by_path(file_path) if self.catalog else None
+        if record is not None and record['sha256']:
+            return 'ok' if record['sha256'] == file_hash else 'corrupted'
+
+        # Content changed without a size or mtime change: bit rot or tampering
+        if previous and unchanged and previous[2] and previous[2] != file_hash:
+            return 'corrupted'
+
+        if record is None and file_hash not in self.processed_hashes:
+            return 'untracked'
+        return 'ok'
+
+    def scrub(self, full: bool = False, reverify_days: float = 30.0, min_age_seconds: float = 60.0,
+              batch_size: int = 256, max_files: Optional[int] = None) -> Dict[str, List[str]]:
+        """
+        Run (or resume) a scrub pass
+
+        Args:
+            full: Re-hash every file, ignoring unchanged size and mtime
+            reverify_days: Re-hash unchanged files last verified longer ago than this
+            min_age_seconds: Skip files modified in the last N seconds
+            batch_size: Files hashed per round (state is committed after each)
+            max_files: Stop after hashing this many files (the pass resumes next time)
+
+        Returns:
+            Dictionary with 'missing', 'corrupted', 'untracked' and 'unreadable' path lists
+        """
+        lower_priority()
+        pass_id, pass_started = self._start_pass(full)
+        reverify_before = time.time() - reverify_days * 86400
+        report = {'missing': [], 'corrupted': [], 'untracked': [], 'unreadable': []}
+        hashed = 0
+        skipped = 0
+        interrupted = False
+
+        with ProcessPoolExecutor(max_workers=self.workers, initializer=lower_priority) as pool:
+            batch = []
+            for file_path, stat in self._iter_files(min_age_seconds):
+                previous = self.connection.execute(
+                    'SELECT size, mtime_ns, sha256, status, scrubbed_at FROM scrubbed_files WHERE path = ?',
+                    (str(file_path),)
+                ).fetchone()
+                unchanged = previous is not None and previous[:2] == (stat.st_size, stat.st_mtime_ns)
+
+                # Already verified in this pass, or unchanged and verified recently
+                if previous and unchanged and (
+                    previous[4] >= pass_started or (not full and previous[4] >= reverify_before)
+                ):
+                    skipped += 1
+                    if previous[3] in ('corrupted', 'untracked'):
+                        report[previous[3]].append(str(file_path))
+                    continue
+
+                batch.append((file_path, stat, previous, unchanged))
+                if len(batch) >= batch_size:
+                    hashed += self._hash_batch(pool, batch, report)
+                    batch = []
+                    if max_files and hashed >= max_files:
+                        interrupted = True
+                        break
+            if batch and not interrupted:
+                hashed += self._hash_batch(pool, batch, report)
+
+        if not interrupted:
+            report['missing'] = self._find_missing()
+            self.connection.execute('UPDATE passes SET finished_at = ? WHERE id = ?', (time.time(), pass_id))
+            self.connection.commit()
+
+        logger.info(f"Scrub pass {pass_id}{' (interrupted)' if interrupted else ''}: {hashed} hashed, "
+                    f"{skipped} unchanged, {len(report['corrupted'])} corrupted, "
+                    f"{len(report['untracked'])} untracked, {len(report['missing'])} missing, "
+                    f"{len(report['unreadable'])} unreadable")
+        return report
+
+    def _hash_batch(self, pool: ProcessPoolExecutor, batch: list, report: Dict[str, List[str]]) -> int:
+        """
+        Hash a batch of files in the process pool and record the results
+
+        Args:
+            pool: Hashing process pool
+            batch: List of (file_path, stat, previous_row, unchanged) tuples
+            report: Report to add findings to
+
+        Returns:
+            Number of files hashed
+        """
+        results = pool.map(hash_file, [str(item[0]) for item in batch], chunksize=8)
+        now = time.time()
+        rows = []
+        for (file_path, stat, previous, unchanged), (_, file_hash, error) in zip(batch, results):
+            if error:
+                logger.warning(f"Failed to hash {file_path}: {error}")
+                report['unreadable'].append(str(file_path))
+                continue
+            status = self._classify(file_path, file_hash, previous, unchanged)
+            if status != 'ok':
+                logger.warning(f"Scrub: {status} file {file_path}")
+                report[status].append(str(file_path))
+            # Keep the last good hash for corrupted files so later passes still flag them
+            recorded_hash = previous[2] if status == 'corrupted' and previous and previous[2] else file_hash
+            rows.append((str(file_path), stat.st_size, stat.st_mtime_ns, recorded_hash, status, now))
+
+        self.connection.executemany(
+            'INSERT OR REPLACE INTO scrubbed_files (path, size, mtime_ns, sha256, status, scrubbed_at) '
+            'VALUES (?, ?, ?, ?, ?, ?)', rows
+        )
+        self.connection.commit()
+        return len(batch)
+
+    def _exists(self, path: str) -> bool:
+        """
+        Check whether a document is on disk or in cold storage
+
+        Args:
+            path: Path of the document
+
+        Returns:
+            True if the document can be read
+        """
+        return Path(path).exists() or bool(self.cold_storage and self.cold_storage.contains(Path(path)))
+
+    def _find_missing(self) -> List[str]:
+        """
+        Find recorded documents whose files no longer exist, and drop state for vanished files
+
+        Returns:
+            Paths of missing documents (from the catalog, or from earlier passes without one)
+        """
+        missing = []
+        if self.catalog:
+            after_id = 0
+            while True:
+                rows = self.catalog.find_documents(after_id=after_id, limit=1000)
+                if not rows:
+                    break
+                for row in rows:
+                    if not self._exists(row['path']):
+                        missing.append(row['path'])
+                after_id = rows[-1]['id']
+
+        vanished = [
+            (path, status) for path, status in self.connection.execute('SELECT path, status FROM scrubbed_files')
+            if not Path(path).exists()
+        ]
+        if not self.catalog:
+            missing = [path for path, status in vanished if status != 'untracked' and not self._exists(path)]
+        self.connection.executemany('DELETE FROM scrubbed_files WHERE path = ?', [(path,) for path, _ in vanished])
+        self.connection.commit()
+
+        for path in missing:
+            logger.warning(f"Scrub: missing file {path}")
+        return missing
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """
+    Command line entry point for scrubbing the document archive
+
+    Args:
+        argv: Command line arguments (defaults to sys.argv)
+
+    Returns:
+        Process exit code (1 if any problem was found)
+    """
+    import config
+
+    parser = argparse.ArgumentParser(description='Verify stored documents against recorded hashes')
+    parser.add_argument('--full', action='store_true', help='Re-hash every file, even if unchanged')
+    parser.add_argument('--reverify-days', type=float, default=30.0,
+                        help='Re-hash unchanged files last verified more than N days ago')
+    parser.add_argument('--workers', type=int, default=config.SCRUB_WORKERS, help='Hashing processes')
+    parser.add_argument('--max-files', type=int, help='Stop after hashing N files (resumed next run)')
+    parser.add_argument('--min-age', type=float, default=60.0, help='Skip files modified in the last N seconds')
+    parser.add_argument('--limit', type=int, default=50, help='Paths to print per category')
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='%(levelname)s - %(message)s')
+
+    hash_file_path = config.DOWNLOAD_BASE_DIR / '.processed_hashes.txt'
+    processed_hashes = set()
+    if hash_file_path.exists():
+        with open(hash_file_path, 'r') as f:
+            processed_hashes = set(line.strip() for line in f if line.strip())
+
+    catalog = DocumentCatalog(config.CATALOG_DB_FILE) if config.CATALOG_ENABLED else None
+    cold_storage = ColdStorage(config.COLD_TIER_DIR) if config.COLD_TIER_DIR.exists() else None
+    scrubber = ArchiveScrubber(
+        document_folders=config.DOCUMENT_FOLDERS,
+        state_db=config.SCRUB_STATE_DB_FILE,
+        catalog=catalog,
+        processed_hashes=processed_hashes,
+        workers=args.workers,
+        cold_storage=cold_storage
+    )
+
+    try:
+        report = scrubber.scrub(
+            full=args.full,
+            reverify_days=args.reverify_days,
+            min_age_seconds=args.min_age,
+            max_files=args.max_files
+        )
+    finally:
+        scrubber.close()
+        if catalog:
+            catalog.close()
+        if cold_storage:
+            cold_storage.close()
+
+    for category in ('corrupted', 'missing', 'untracked', 'unreadable'):
+        paths = report[category]
+        print(f"{category.capitalize()}: {len(paths)}")
+        for path in paths[:args.limit]:
+            print(f"  {path}")
+        if len(paths) > args.limit:
+            print(f"  ... {len(paths) - args.limit} more")
+
+    return 1 if report['corrupted'] or report['missing'] or report['unreadable'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,245 @@
+"""
+Artifact Cache Module
+Size-bounded LRU cache of derived artifacts keyed by (content hash, processor, version)
+"""
+import sys
+import time
+import hashlib
+import sqlite3
+import logging
+import argparse
+import threading
+from pathlib import Path
+from typing import List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class ArtifactCache:
+    """
+    SQLite-backed store of processor outputs, evicting the least recently used entries
+    once the total size exceeds the limit
+    An empty artifact records that the processor produced nothing for the content
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS artifacts (
+            sha256 TEXT NOT NULL,
+            processor TEXT NOT NULL,
+            version INTEGER NOT NULL,
+            data BLOB NOT NULL,
+            size INTEGER NOT NULL,
+            last_access REAL NOT NULL,
+            PRIMARY KEY (sha256, processor, version)
+        );
+        CREATE INDEX IF NOT EXISTS idx_artifacts_last_access ON artifacts (last_access);
+    """
+
+    def __init__(self, db_path: Path, max_bytes: int):
+        """
+        Open (or create) the artifact cache
+
+        Args:
+            db_path: Path to the SQLite database file
+            max_bytes: Total artifact size above which old entries are evicted
+        """
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self.connection = sqlite3.connect(str(db_path), check_same_thread=False)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('PRAGMA synchronous=NORMAL')
+        self.connection.executescript(self.SCHEMA)
+        self.connection.commit()
+        self.total_bytes = self.connection.execute(
+            'SELECT COALESCE(SUM(size), 0) FROM artifacts'
+        ).fetchone()[0]
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def close(self):
+        """Close the cache"""
+        try:
+            self.connection.close()
+        except Exception as e:
+            logger.warning(f"Error closing artifact cache: {e}")
+
+    def get(self, file_hash: str, processor: str, version: int) -> Optional[bytes]:
+        """
+        Look up an artifact and mark it as recently used
+
+        Args:
+            file_hash: SHA256 hash of the source document
+            processor: Processor name
+            version: Processor version
+
+        Returns:
+            Artifact bytes (empty if the processor produced nothing), or None if not cached
+        """
+        key = (file_hash, processor, version)
+        with self._lock:
+            row = self.connection.execute(
+                'SELECT data FROM artifacts WHERE sha256 = ? AND processor = ? AND version = ?', key
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.connection.execute(
+                'UPDATE artifacts SET last_access = ? WHERE sha256 = ? AND processor = ? AND version = ?',
+                (time.time(), *key)
+            )
+            self.connection.commit()
+            self.hits += 1
+            return row[0]
+
+    def contains(self, file_hash: str, processor: str, version: int) -> bool:
+        """
+        Check for an artifact without loading it, marking it as recently used
+
+        Args:
+            file_hash: SHA256 hash of the source document
+            processor: Processor name
+            version: Processor version
+
+        Returns:
+            True if the artifact is cached
+        """
+        with self._lock:
+            cursor = self.connection.execute(
+                'UPDATE artifacts SET last_access = ? WHERE sha256 = ? AND processor = ? AND version = ?',
+                (time.time(), file_hash, processor, version)
+            )
+            self.connection.commit()
+            if cursor.rowcount:
+                self.hits += 1
+                return True
+            self.misses += 1
+            return False
+
+    def put(self, file_hash: str, processor: str, version: int, data: bytes):
+        """
+        Store an artifact, evicting least recently used entries if over the limit
+
+        Args:
+            file_hash: SHA256 hash of the source document
+            processor: Processor name
+            version: Processor version
+            data: Artifact bytes
+        """
+        if len(data) > self.max_bytes:
+            logger.debug(f"Artifact {processor} for {file_hash[:12]} exceeds the cache size, not stored")
+            return
+
+        try:
+            with self._lock:
+                previous = self.connection.execute(
+                    'SELECT size FROM artifacts WHERE sha256 = ? AND processor = ? AND version = ?',
+                    (file_hash, processor, version)
+                ).fetchone()
+                self.connection.execute(
+                    'INSERT OR REPLACE INTO artifacts (sha256, processor, version, data, size, last_access) '
+                    'VALUES (?, ?, ?, ?, ?, ?)',
+                    (file_hash, processor, version, sqlite3.Binary(data), len(data), time.time())
+                )
+                self.total_bytes += len(data) - (previous[0] if previous else 0)
+                self._evict()
+                self.connection.commit()
+        except Exception as e:
+            logger.error(f"Failed to cache artifact {processor} for {file_hash[:12]}: {e}")
+
+    def _evict(self):
+        """Delete least recently used artifacts until the total fits (caller holds the lock)"""
+        while self.total_bytes > self.max_bytes:
+            rows = self.connection.execute(
+                'SELECT rowid, size FROM artifacts ORDER BY last_access LIMIT 64'
+            ).fetchall()
+            if not rows:
+                self.total_bytes = 0
+                return
+            for rowid, size in rows:
+                if self.total_bytes <= self.max_bytes:
+                    break
+                self.connection.execute('DELETE FROM artifacts WHERE rowid = ?', (rowid,))
+                self.total_bytes -= size
+                self.evictions += 1
+
+    def summary(self) -> str:
+        """
+        Describe cache usage during the run
+
+        Returns:
+            One-line summary for the run log
+        """
+        return (f"{self.hits} hits, {self.misses} misses, {self.evictions} evictions, "
+                f"{self.total_bytes / (1024 * 1024):.1f} of {self.max_bytes / (1024 * 1024):.0f} MB used")
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """
+    Command line entry point for reading cached artifacts
+
+    Args:
+        argv: Command line arguments (defaults to sys.argv)
+
+    Returns:
+        Process exit code
+    """
+    import config
+    from post_processing import build_processors
+
+    parser = argparse.ArgumentParser(description='Read derived artifacts for a stored document')
+    parser.add_argument('document', help='Path to a stored document')
+    parser.add_argument('--processor', required=True, help='Processor name (e.g. text, page_count, thumbnail)')
+    parser.add_argument('--output', help='Write the artifact to this file instead of stdout')
+    args = parser.parse_args(argv)
+
+    processors = {processor.name: processor for processor in build_processors(config.ARTIFACT_PROCESSORS)}
+    processor = processors.get(args.processor)
+    if processor is None:
+        print(f"ERROR: Unknown or disabled processor: {args.processor}")
+        return 1
+
+    # Resolved the way the cold-storage index stores paths, so relative paths work too
+    document = Path(args.document).resolve()
+    if not config.ARTIFACT_CACHE_DB_FILE.exists():
+        print(f"ERROR: Artifact cache not found: {config.ARTIFACT_CACHE_DB_FILE}")
+        return 1
+
+    if document.exists():
+        file_hash = hashlib.sha256(document.read_bytes()).hexdigest()
+    else:
+        # Documents moved to the cold tier keep their artifacts under the same content hash
+        row = None
+        if config.COLD_TIER_DIR.exists():
+            from cold_storage import ColdStorage
+            cold_storage = ColdStorage(config.COLD_TIER_DIR)
+            try:
+                row = cold_storage.lookup(document)
+            finally:
+                cold_storage.close()
+        if row is None:
+            print(f"ERROR: Document not found: {document}")
+            return 1
+        file_hash = row['sha256']
+
+    cache = ArtifactCache(config.ARTIFACT_CACHE_DB_FILE, config.ARTIFACT_CACHE_MAX_MB * 1024 * 1024)
+    try:
+        data = cache.get(file_hash, processor.name, processor.version)
+    finally:
+        cache.close()
+
+    if data is None:
+        print("Artifact not cached")
+        return 1
+    if not data:
+        print(f"No {processor.name} artifact for this document")
+        return 1
+    if args.output:
+        Path(args.output).write_bytes(data)
+    else:
+        sys.stdout.buffer.write(data + b'\n')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -6,18 +6,34 @@ import os
 import email
 import hashlib
 import logging
+import binascii
 from pathlib import Path
-from typing import List, Tuple, Optional
+from typing import Callable, List, Tuple, Optional, Union
+
+import pipeline_profiler
+from near_duplicate import NearDuplicateDetector
+from memory_budget import MemoryBudget, SpilledAttachment, create_spill_file
+from write_journal import JournalEntry
 
 logger = logging.getLogger(__name__)
 
+# Encoded characters decoded per step when streaming a payload to a spill file
+SPILL_CHUNK_CHARS = 1024 * 1024
+
 
 class AttachmentHandler:
     """
     Handles attachment extraction, validation, and storage
     """
     
-    def __init__(self, download_base_dir: Path, allowed_extensions: List[str], max_size_mb: int = 25):
+    def __init__(self, download_base_dir: Path, allowed_extensions: List[str], max_size_mb: int = 25,
+                 near_duplicate_detector: Optional[NearDuplicateDetector] = None,
+                 near_duplicate_action: str = 'flag',
+                 hash_claimer: Optional[Callable[[str], bool]] = None,
+                 hash_releaser: Optional[Callable[[str], None]] = None,
+                 memory_budget: Optional[MemoryBudget] = None,
+                 spill_dir: Optional[Path] = None,
+                 spill_timeout: float = 0.0):
         """
         Initialize attachment handler
         
@@ -25,11 +41,32 @@ class AttachmentHandler:
             download_base_dir: Base directory for storing attachments
             allowed_extensions: List of permitted file extensions
             max_size_mb: Maximum allowed attachment size in megabytes
+            near_duplicate_detector: Optional similarity index for re-sent scans
+            near_duplicate_action: 'flag' to log near-duplicates, 'skip' to drop them
+            hash_claimer: Optional atomic claim shared with other workers; returns False
+                if another worker already took the hash
+            hash_releaser: Optional counterpart of hash_claimer, called for claimed
+                attachments that end up not being stored
+            memory_budget: Optional budget for decoded payloads; payloads that do not fit
+                are streamed to spill files instead
+            spill_dir: Folder for spill files (defaults to <download_base_dir>/.spool)
+            spill_timeout: Seconds to wait for budget before spilling
         """
         self.download_base_dir = download_base_dir
         self.allowed_extensions = [ext.lower() for ext in allowed_extensions]
         self.max_size_bytes = max_size_mb * 1024 * 1024
         self.processed_hashes = self._load_processed_hashes()
+        self.near_duplicate_detector = near_duplicate_detector
+        self.near_duplicate_action = near_duplicate_action
+        self.hash_claimer = hash_claimer
+        self.hash_releaser = hash_releaser
+        self.memory_budget = memory_budget
+        self.spill_dir = spill_dir or download_base_dir / '.spool'
+        self.spill_timeout = spill_timeout
+        # Budget reserved per in-memory payload, keyed by id() until released
+        self._reservations = {}
+        # Near-duplicate fingerprints of accepted attachments, indexed once their documents are durable
+        self._pending_fingerprints = {}
         
     def _load_processed_hashes(self) -> set:
         """
@@ -51,20 +88,31 @@ class AttachmentHandler:
         
         return hashes
     
-    def _save_processed_hash(self, file_hash: str):
+    def save_processed_hashes(self, hashes: List[str], fsync: bool = True):
         """
-        Save a file hash to prevent duplicate processing
+        Persist hashes of stored documents to prevent duplicate processing, and add their
+        near-duplicate fingerprints to the index
+        Called by the write journal once the documents themselves are durable
         
         Args:
-            file_hash: SHA256 hash of the file
+            hashes: SHA256 hashes of the stored files
+            fsync: Flush the hash file to stable storage
+            
+        Raises:
+            OSError: If the hash file cannot be written
         """
         hash_file = self.download_base_dir / '.processed_hashes.txt'
-        try:
-            with open(hash_file, 'a') as f:
-                f.write(f"{file_hash}\n")
-            self.processed_hashes.add(file_hash)
-        except Exception as e:
-            logger.error(f"Failed to save processed hash: {e}")
+        with open(hash_file, 'a') as f:
+            f.write(''.join(f"{file_hash}\n" for file_hash in hashes))
+            if fsync:
+                f.flush()
+                os.fsync(f.fileno())
+        self.processed_hashes.update(hashes)
+        
+        for file_hash in hashes:
+            fingerprint = self._pending_fingerprints.pop(file_hash, None)
+            if fingerprint:
+                self.near_duplicate_detector.add(file_hash, *fingerprint)
     
     @staticmethod
     def _calculate_hash(data: bytes) -> str:
@@ -110,15 +158,196 @@ class AttachmentHandler:
             return False
         return True
     
-    def extract_attachments(self, email_message: email.message.Message) -> List[Tuple[str, bytes]]:
+    def _is_near_duplicate(self, filename: str, file_data: bytes, file_hash: str) -> bool:
+        """
+        Check an attachment against the near-duplicate index
+        The fingerprint is only indexed once the document is committed (save_processed_hashes),
+        so a rolled-back document never matches its own re-delivery
+        
+        Args:
+            filename: Name of the file
+            file_data: File content as bytes
+            file_hash: SHA256 hash of the file
+            
+        Returns:
+            True if the attachment should be skipped as a near-duplicate
+        """
+        fingerprint = self.near_duplicate_detector.fingerprint(filename, file_data)
+        if fingerprint is None:
+            return False
+        
+        kind, signature = fingerprint
+        match = self.near_duplicate_detector.find_match(kind, signature, exclude_hash=file_hash)
+        if match:
+            match_hash, similarity = match
+            if self.near_duplicate_action == 'skip':
+                logger.info(f"Skipping near-duplicate file: {filename} "
+                            f"({similarity:.0%} similar to {match_hash[:12]})")
+                return True
+            logger.warning(f"Near-duplicate file: {filename} ({similarity:.0%} similar to {match_hash[:12]})")
+        
+        self._pending_fingerprints[file_hash] = (kind, signature)
+        return False
+    
+    def _spill_payload(self, part: email.message.Message, filename: str) -> Optional[SpilledAttachment]:
+        """
+        Decode an attachment straight into a spill file, hashing as it goes
+        Base64 payloads are decoded in bounded chunks so the decoded content is never held in memory
+        
+        Args:
+            part: Email part holding the attachment
+            filename: Name of the file
+            
+        Returns:
+            Spilled attachment, or None if it is empty or oversized
+        """
+        f, path = create_spill_file(self.spill_dir)
+        sha256 = hashlib.sha256()
+        size = 0
+        
+        try:
+            with f:
+                if part.get('Content-Transfer-Encoding', '').strip().lower() == 'base64':
+                    encoded = part.get_payload()
+                    remainder = ''
+                    for offset in range(0, len(encoded), SPILL_CHUNK_CHARS):
+                        chunk = remainder + ''.join(encoded[offset:offset + SPILL_CHUNK_CHARS].split())
+                        usable = len(chunk) // 4 * 4
+                        decoded = binascii.a2b_base64(chunk[:usable])
+                        remainder = chunk[usable:]
+                        f.write(decoded)
+                        sha256.update(decoded)
+                        size += len(decoded)
+                        if size > self.max_size_bytes:
+                            break
+                else:
+                    decoded = part.get_payload(decode=True) or b''
+                    f.write(decoded)
+                    sha256.update(decoded)
+                    size = len(decoded)
+        except Exception:
+            path.unlink(missing_ok=True)
+            raise
+        
+        spilled = SpilledAttachment(path, size, sha256.hexdigest())
+        if size == 0 or size > self.max_size_bytes:
+            spilled.discard()
+            if size:
+                logger.warning(f"Skipping oversized file: {filename}")
+            return None
+        
+        logger.debug(f"Spilled attachment {filename} to {path} ({size / 1024:.2f} KB)")
+        return spilled
+    
+    def _decode_payload(self, part: email.message.Message,
+                        filename: str) -> Optional[Union[bytes, SpilledAttachment]]:
+        """
+        Decode an attachment, in memory if the budget allows, otherwise to a spill file
+        
+        Args:
+            part: Email part holding the attachment
+            filename: Name of the file
+            
+        Returns:
+            Decoded content or spilled attachment, or None if there is no content
+        """
+        if not self.memory_budget:
+            return part.get_payload(decode=True)
+        
+        # Base64 decodes to about three quarters of its encoded length
+        encoded_length = len(part.get_payload() or '')
+        estimate = encoded_length * 3 // 4 + 1
+        
+        if not self.memory_budget.acquire(estimate, timeout=self.spill_timeout):
+            return self._spill_payload(part, filename)
+        
+        try:
+            file_data = part.get_payload(decode=True)
+        except Exception:
+            self.memory_budget.release(estimate)
+            raise
+        if file_data:
+            self._reservations[id(file_data)] = estimate
+        else:
+            self.memory_budget.release(estimate)
+        return file_data
+    
+    def release_attachment(self, file_data: Union[bytes, SpilledAttachment]):
+        """
+        Return an attachment's memory budget, or remove its spill file
+        
+        Args:
+            file_data: Content returned by extract_attachments
+        """
+        if isinstance(file_data, SpilledAttachment):
+            file_data.discard()
+        elif self.memory_budget:
+            reserved = self._reservations.pop(id(file_data), 0)
+            if reserved:
+                self.memory_budget.release(reserved)
+    
+    def _is_new_attachment(self, filename: str, file_data: Union[bytes, SpilledAttachment],
+                           file_hash: str) -> bool:
+        """
+        Run the duplicate checks on a decoded attachment
+        
+        Args:
+            filename: Name of the file
+            file_data: Decoded content or spilled attachment
+            file_hash: SHA256 hash of the content
+            
+        Returns:
+            True if the attachment should be kept
+        """
+        if file_hash in self.processed_hashes:
+            logger.info(f"Skipping duplicate file: {filename}")
+            return False
+        if self.hash_claimer and not self.hash_claimer(file_hash):
+            logger.info(f"Skipping file claimed by another worker: {filename}")
+            self.processed_hashes.add(file_hash)
+            return False
+        
+        # Check for re-sent scans and re-exports
+        if self.near_duplicate_detector:
+            try:
+                if isinstance(file_data, SpilledAttachment):
+                    logger.debug(f"Skipping near-duplicate check for spilled file: {filename}")
+                elif self._is_near_duplicate(filename, file_data, file_hash):
+                    self.release_claim(file_hash)
+                    return False
+            except Exception:
+                self.release_claim(file_hash)
+                raise
+        
+        return True
+    
+    def release_claim(self, file_hash: str):
+        """
+        Forget an attachment that was accepted but not stored, so a re-delivery is stored again
+        
+        Args:
+            file_hash: SHA256 hash of the attachment
+        """
+        self.processed_hashes.discard(file_hash)
+        self._pending_fingerprints.pop(file_hash, None)
+        if self.hash_releaser:
+            self.hash_releaser(file_hash)
+    
+    def extract_attachments(self, email_message: email.message.Message
+                            ) -> List[Tuple[str, Union[bytes, SpilledAttachment], str]]:
         """
         Extract all attachments from an email message
+        With a memory budget, attachments that do not fit are returned as spill files;
+        callers pass each returned attachment to release_attachment when done with it
+        
+        Hashes are only persisted through save_processed_hashes once the documents are
+        stored, so a crash before then does not mark an unsaved attachment as seen
         
         Args:
             email_message: Email message object
             
         Returns:
-            List of tuples containing (filename, file_data)
+            List of tuples containing (filename, file_data, file_hash)
         """
         attachments = []
         
@@ -143,39 +372,55 @@ class AttachmentHandler:
                         continue
                     
                     # Get file data
-                    file_data = part.get_payload(decode=True)
+                    file_data = self._decode_payload(part, filename)
+                    if not file_data:
+                        continue
                     
-                    if file_data:
+                    # Anything not handed to the caller gives back its budget or spill file
+                    kept = False
+                    try:
                         # Validate size
                         if not self._is_valid_size(file_data):
                             logger.warning(f"Skipping oversized file: {filename}")
                             continue
                         
                         # Check for duplicates using hash
-                        file_hash = self._calculate_hash(file_data)
-                        if file_hash in self.processed_hashes:
-                            logger.info(f"Skipping duplicate file: {filename}")
+                        if isinstance(file_data, SpilledAttachment):
+                            file_hash = file_data.file_hash
+                        else:
+                            with pipeline_profiler.stage('hashing'):
+                                file_hash = self._calculate_hash(file_data)
+                        
+                        if not self._is_new_attachment(filename, file_data, file_hash):
                             continue
                         
-                        attachments.append((filename, file_data))
+                        attachments.append((filename, file_data, file_hash))
+                        kept = True
                         logger.info(f"Extracted attachment: {filename} ({len(file_data) / 1024:.2f} KB)")
                         
-                        # Mark as processed
-                        self._save_processed_hash(file_hash)
+                        # Skip repeats within this run; persisted after the document is stored
+                        self.processed_hashes.add(file_hash)
+                    finally:
+                        if not kept:
+                            self.release_attachment(file_data)
         
         except Exception as e:
             logger.error(f"Error extracting attachments: {e}")
         
         return attachments
     
-    def save_attachment(self, filename: str, file_data: bytes, destination_folder: Path) -> Optional[Path]:
+    def save_attachment(self, filename: str, file_data: Union[bytes, SpilledAttachment],
+                        destination_folder: Path,
+                        journal_entry: Optional[JournalEntry] = None) -> Optional[Path]:
         """
         Save attachment to specified folder
         
         Args:
             filename: Original filename
-            file_data: File content as bytes
+            file_data: File content as bytes, or a spilled attachment (moved into place)
             destination_folder: Target folder for saving
+            journal_entry: Optional write-journal entry; the reserved path is recorded
+                before any data is written
             
         Returns:
             Path to saved file, or None if failed
@@ -188,18 +433,29 @@ class AttachmentHandler:
             file_path = destination_folder / filename
             
             # Handle duplicate filenames
+            # Exclusive create ('x') makes the name check atomic across concurrent workers
             counter = 1
             original_stem = file_path.stem
             original_suffix = file_path.suffix
             
-            while file_path.exists():
-                new_name = f"{original_stem}_{counter}{original_suffix}"
-                file_path = destination_folder / new_name
-                counter += 1
+            while True:
+                try:
+                    f = open(file_path, 'xb')
+                    break
+                except FileExistsError:
+                    new_name = f"{original_stem}_{counter}{original_suffix}"
+                    file_path = destination_folder / new_name
+                    counter += 1
+            
+            if journal_entry:
+                journal_entry.record_write(file_path)
             
             # Write file
-            with open(file_path, 'wb') as f:
-                f.write(file_data)
+            with f:
+                if not isinstance(file_data, SpilledAttachment):
+                    f.write(file_data)
+            if isinstance(file_data, SpilledAttachment):
+                os.replace(file_data.path, file_path)
             
             logger.info(f"Saved attachment to: {file_path}")
             return file_path
@@ -0,0 +1,455 @@
+"""
+Cold Storage Module
+Moves old documents into append-only compressed pack files with a SQLite index for random access
+"""
+import os
+import sys
+import time
+import zlib
+import struct
+import sqlite3
+import hashlib
+import logging
+import argparse
+import threading
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Optional: zstd compression (zlib is used otherwise)
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Entry header: magic, codec, path length, original size, stored length, sha256 digest
+ENTRY_HEADER = struct.Struct('<4sBHQQ32s')
+ENTRY_MAGIC = b'EDPK'
+CODEC_ZLIB = 1
+CODEC_ZSTD = 2
+
+
+class ColdStorage:
+    """
+    Append-only pack files holding compressed documents, indexed by original path and hash
+
+    Each entry is self-describing (header, original path, compressed data), so the index can
+    be rebuilt from the packs. Packing appends a batch, fsyncs the pack, commits the index
+    and only then deletes the original files; a crash leaves at most an unreferenced tail.
+    Paths are stored resolved, and a packed path stays reserved: new documents are never
+    given its name (see DocumentProcessor.organize_document), so an entry is never replaced.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS packed_documents (
+            path TEXT PRIMARY KEY,
+            sha256 TEXT NOT NULL,
+            pack TEXT NOT NULL,
+            offset INTEGER NOT NULL,
+            size INTEGER NOT NULL,
+            codec INTEGER NOT NULL,
+            mtime_ns INTEGER NOT NULL,
+            packed_at REAL NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS idx_packed_documents_sha256 ON packed_documents (sha256);
+    """
+
+    def __init__(self, pack_dir: Path, max_pack_bytes: int = 1024 * 1024 * 1024,
+                 compression: str = 'auto', level: int = 6):
+        """
+        Open (or create) cold storage
+
+        Args:
+            pack_dir: Folder holding the pack files and the index
+            max_pack_bytes: Size at which a new pack file is started
+            compression: 'zstd', 'zlib', or 'auto' (zstd if installed)
+            level: Compression level
+        """
+        self.pack_dir = pack_dir
+        self.pack_dir.mkdir(parents=True, exist_ok=True)
+        self.max_pack_bytes = max_pack_bytes
+        self.level = level
+
+        if compression == 'zstd' and zstandard is None:
+            logger.warning("zstandard is not installed, packing with zlib")
+        use_zstd = zstandard is not None and compression in ('zstd', 'auto')
+        self.codec = CODEC_ZSTD if use_zstd else CODEC_ZLIB
+
+        self._lock = threading.Lock()
+        self.connection = sqlite3.connect(str(pack_dir / 'index.db'), check_same_thread=False)
+        self.connection.row_factory = sqlite3.Row
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.executescript(self.SCHEMA)
+        self.connection.commit()
+
+    def close(self):
+        """Close the index"""
+        try:
+            self.connection.close()
+        except Exception as e:
+            logger.warning(f"Error closing cold storage: {e}")
+
+    def _compress(self, data: bytes) -> bytes:
+        """Compress an entry with the configured codec"""
+        if self.codec == CODEC_ZSTD:
+            return zstandard.ZstdCompressor(level=self.level).compress(data)
+        return zlib.compress(data, self.level)
+
+    @staticmethod
+    def _decompress(codec: int, data: bytes) -> bytes:
+        """Decompress an entry"""
+        if codec == CODEC_ZSTD:
+            if zstandard is None:
+                raise RuntimeError("Entry is zstd-compressed but zstandard is not installed")
+            return zstandard.ZstdDecompressor().decompress(data)
+        return zlib.decompress(data)
+
+    def _current_pack(self) -> Path:
+        """
+        Pick the pack file to append to, starting a new one when the last is full
+
+        Returns:
+            Path of the pack file
+        """
+        packs = sorted(self.pack_dir.glob('pack-*.pack'))
+        if packs and packs[-1].stat().st_size < self.max_pack_bytes:
+            return packs[-1]
+        number = int(packs[-1].stem.split('-')[1]) + 1 if packs else 1
+        return self.pack_dir / f"pack-{number:05d}.pack"
+
+    @staticmethod
+    def _key(path: Path) -> str:
+        """Index key of a path: absolute, with symlinks and '..' resolved"""
+        return str(Path(path).resolve())
+
+    def lookup(self, path: Path) -> Optional[sqlite3.Row]:
+        """
+        Find the index entry for an original document path
+
+        Args:
+            path: Original path of the document (relative paths are resolved)
+
+        Returns:
+            Index row, or None if the document is not packed
+        """
+        with self._lock:
+            return self.connection.execute(
+                'SELECT * FROM packed_documents WHERE path = ?', (self._key(path),)
+            ).fetchone()
+
+    def contains(self, path: Path) -> bool:
+        """
+        Check whether a document is packed
+
+        Args:
+            path: Original path of the document
+
+        Returns:
+            True if the document can be read from a pack
+        """
+        return self.lookup(path) is not None
+
+    def _read_entry(self, row: sqlite3.Row) -> Optional[bytes]:
+        """
+        Read, decompress and verify a packed entry
+
+        Args:
+            row: Index row
+
+        Returns:
+            Original document bytes, or None if the entry is damaged
+        """
+        try:
+            with open(self.pack_dir / row['pack'], 'rb') as f:
+                f.seek(row['offset'])
+                magic, codec, path_length, size, length, digest = ENTRY_HEADER.unpack(f.read(ENTRY_HEADER.size))
+                if magic != ENTRY_MAGIC:
+                    raise ValueError("bad entry header")
+                f.seek(path_length, os.SEEK_CUR)
+                data = self._decompress(codec, f.read(length))
+            if len(data) != size or hashlib.sha256(data).digest() != digest:
+                raise ValueError("checksum mismatch")
+            return data
+        except Exception as e:
+            logger.error(f"Failed to read {row['path']} from {row['pack']}: {e}")
+            return None
+
+    def read(self, path: Path) -> Optional[bytes]:
+        """
+        Read a packed document by its original path
+
+        Args:
+            path: Original path of the document
+
+        Returns:
+            Document bytes, or None if not packed or damaged
+        """
+        row = self.lookup(path)
+        return self._read_entry(row) if row else None
+
+    def read_by_hash(self, file_hash: str) -> Optional[bytes]:
+        """
+        Read a packed document by content hash
+
+        Args:
+            file_hash: SHA256 hash of the document
+
+        Returns:
+            Document bytes, or None if no packed document has this hash
+        """
+        with self._lock:
+            row = self.connection.execute(
+                'SELECT * FROM packed_documents WHERE sha256 = ? LIMIT 1', (file_hash,)
+            ).fetchone()
+        return self._read_entry(row) if row else None
+
+    def extract(self, path: Path, destination: Optional[Path] = None, remove: bool = False) -> Optional[Path]:
+        """
+        Write a packed document back to disk
+
+        Args:
+            path: Original path of the document
+            destination: Target file (defaults to the original path)
+            remove: Drop the document from the index after restoring it to its original path
+
+        Returns:
+            Path written, or None if the document could not be read
+        """
+        data = self.read(path)
+        if data is None:
+            return None
+
+        path = Path(self._key(path))
+        destination = Path(self._key(destination)) if destination else path
+        destination.parent.mkdir(parents=True, exist_ok=True)
+        temp_path = destination.with_name(f".{destination.name}.extract")
+        temp_path.write_bytes(data)
+        os.replace(temp_path, destination)
+
+        if remove and destination == path:
+            with self._lock:
+                self.connection.execute('DELETE FROM packed_documents WHERE path = ?', (str(path),))
+                self.connection.commit()
+        return destination
+
+    def pack_files(self, files: Iterable[Path], batch_size: int = 500) -> int:
+        """
+        Move documents into pack files
+
+        Args:
+            files: Documents to pack
+            batch_size: Documents appended between fsync/commit/delete rounds
+
+        Returns:
+            Number of documents packed
+        """
+        packed = 0
+        batch = []
+        for file_path in files:
+            batch.append(file_path)
+            if len(batch) >= batch_size:
+                packed += self._pack_batch(batch)
+                batch = []
+        if batch:
+            packed += self._pack_batch(batch)
+        return packed
+
+    def _pack_batch(self, files: List[Path]) -> int:
+        """
+        Append a batch of documents, make it durable, index it and delete the originals
+
+        Args:
+            files: Documents to pack
+
+        Returns:
+            Number of documents packed
+        """
+        pack_path = self._current_pack()
+        rows = []
+        done = []
+
+        with open(pack_path, 'ab') as pack:
+            for file_path in files:
+                try:
+                    file_path = Path(self._key(file_path))
+                    stat = file_path.stat()
+                    data = file_path.read_bytes()
+                    digest = hashlib.sha256(data).digest()
+
+                    existing = self.lookup(file_path)
+                    if existing:
+                        if existing['sha256'] == digest.hex():
+                            # Packed by an earlier run that stopped before deleting the original
+                            done.append(file_path)
+                        else:
+                            # Never replace a packed document; its name should not have been reused
+                            logger.error(f"{file_path} is already packed with other content, leaving it on disk")
+                        continue
+
+                    encoded_path = str(file_path).encode('utf-8')
+                    compressed = self._compress(data)
+                    offset = pack.tell()
+                    pack.write(ENTRY_HEADER.pack(ENTRY_MAGIC, self.codec, len(encoded_path),
+                                                 len(data), len(compressed), digest))
+                    pack.write(encoded_path)
+                    pack.write(compressed)
+                    rows.append((str(file_path), digest.hex(), pack_path.name, offset, len(data),
+                                 self.codec, stat.st_mtime_ns, time.time()))
+                    done.append(file_path)
+                except Exception as e:
+                    logger.error(f"Failed to pack {file_path}: {e}")
+            pack.flush()
+            os.fsync(pack.fileno())
+
+        with self._lock:
+            try:
+                self.connection.executemany(
+                    'INSERT INTO packed_documents '
+                    '(path, sha256, pack, offset, size, codec, mtime_ns, packed_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                    rows
+                )
+                self.connection.commit()
+            except sqlite3.IntegrityError as e:
+                # Another packer indexed one of these paths meanwhile; keep every original
+                self.connection.rollback()
+                logger.error(f"Failed to index batch for {pack_path.name}, originals kept: {e}")
+                return 0
+
+        for file_path in done:
+            try:
+                file_path.unlink()
+            except Exception as e:
+                logger.warning(f"Packed {file_path} but could not remove it: {e}")
+
+        logger.info(f"Packed {len(rows)} documents into {pack_path.name}")
+        return len(done)
+
+
+def iter_cold_candidates(document_folders: Dict[str, Path], older_than_days: float,
+                         max_file_bytes: int) -> Iterator[Path]:
+    """
+    Find documents old and small enough to move to cold storage
+
+    Args:
+        document_folders: Dictionary mapping folder names to Path objects
+        older_than_days: Minimum age by modification time
+        max_file_bytes: Larger files stay on disk (they do not waste inodes)
+
+    Yields:
+        Paths of documents to pack
+    """
+    cutoff = time.time() - older_than_days * 86400
+    for folder in document_folders.values():
+        if not folder.exists():
+            continue
+        for directory, dirnames, filenames in os.walk(folder):
+            dirnames[:] = [name for name in dirnames if not name.startswith('.')]
+            for filename in filenames:
+                if filename.startswith('.'):
+                    continue
+                file_path = Path(directory) / filename
+                try:
+                    stat = file_path.stat()
+                except FileNotFoundError:
+                    continue
+                if stat.st_mtime < cutoff and stat.st_size <= max_file_bytes:
+                    yield file_path
+
+
+def read_document(path: Path, cold_storage: Optional[ColdStorage] = None) -> Optional[bytes]:
+    """
+    Read a document from disk, or from cold storage if it has been packed
+
+    Args:
+        path: Path of the document (as stored in the catalog)
+        cold_storage: Optional cold storage to fall back to
+
+    Returns:
+        Document bytes, or None if it cannot be found
+    """
+    if path.exists():
+        return path.read_bytes()
+    if cold_storage:
+        return cold_storage.read(path)
+    return None
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """
+    Command line entry point for packing and reading cold documents
+
+    Args:
+        argv: Command line arguments (defaults to sys.argv)
+
+    Returns:
+        Process exit code
+    """
+    import config
+
+    parser = argparse.ArgumentParser(description='Move old documents into compressed pack files')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    pack_parser = subparsers.add_parser('pack', help='Pack documents older than the threshold')
+    pack_parser.add_argument('--older-than-days', type=float, default=config.COLD_TIER_AGE_DAYS)
+    pack_parser.add_argument('--max-file-kb', type=int, default=config.COLD_TIER_MAX_FILE_KB)
+    pack_parser.add_argument('--dry-run', action='store_true', help='Only list the documents to pack')
+
+    extract_parser = subparsers.add_parser('extract', help='Write a packed document to disk')
+    extract_parser.add_argument('path', type=Path, help='Original path of the document')
+    extract_parser.add_argument('--output', type=Path, help='Target file (defaults to the original path)')
+    extract_parser.add_argument('--unpack', action='store_true',
+                                help='Restore to the original path and remove from the pack index')
+
+    cat_parser = subparsers.add_parser('cat', help='Write a packed document to stdout')
+    cat_group = cat_parser.add_mutually_exclusive_group(required=True)
+    cat_group.add_argument('path', type=Path, nargs='?', help='Original path of the document')
+    cat_group.add_argument('--sha256', help='Content hash')
+
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='%(levelname)s - %(message)s')
+
+    storage = ColdStorage(
+        config.COLD_TIER_DIR,
+        max_pack_bytes=config.COLD_TIER_PACK_MAX_MB * 1024 * 1024,
+        compression=config.COLD_TIER_COMPRESSION
+    )
+    try:
+        if args.command == 'pack':
+            candidates = iter_cold_candidates(
+                config.DOCUMENT_FOLDERS, args.older_than_days, args.max_file_kb * 1024
+            )
+            if args.dry_run:
+                count = 0
+                for file_path in candidates:
+                    print(file_path)
+                    count += 1
+                print(f"{count} documents would be packed")
+            else:
+                print(f"Packed {storage.pack_files(candidates)} documents")
+            return 0
+
+        if args.command == 'extract':
+            # Resolved the way the index stores paths, so relative paths work too
+            args.path = args.path.resolve()
+            destination = args.path if args.unpack else args.output
+            written = storage.extract(args.path, destination, remove=args.unpack)
+            if written is None:
+                print(f"ERROR: Not packed or unreadable: {args.path}")
+                return 1
+            print(f"Extracted to {written}")
+            return 0
+
+        data = storage.read_by_hash(args.sha256) if args.sha256 else storage.read(args.path.resolve())
+        if data is None:
+            print("ERROR: Document not found in cold storage")
+            return 1
+        sys.stdout.buffer.write(data)
+        return 0
+    finally:
+        storage.close()
+
+
+if __name__ == '__main__':
+    sys.exit(main())
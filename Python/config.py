@@ -3,6 +3,7 @@ Configuration module for Email & Document Automation Bot
 Contains email credentials, folder paths, and application settings
 """
 import os
+import socket
 from pathlib import Path
 from dotenv import load_dotenv
 
@@ -16,6 +17,16 @@ EMAIL_PORT = int(os.getenv('EMAIL_PORT', '993'))
 EMAIL_USER = os.getenv('EMAIL_USER', 'your_email@example.com')
 EMAIL_PASSWORD = os.getenv('EMAIL_PASSWORD', 'your_password')
 
+# IMAP rate control (adaptive batch size and pacing, retries with jittered backoff)
+IMAP_INITIAL_BATCH = int(os.getenv('IMAP_INITIAL_BATCH', '5'))
+IMAP_MAX_BATCH = int(os.getenv('IMAP_MAX_BATCH', '50'))
+IMAP_TARGET_LATENCY_SECONDS = float(os.getenv('IMAP_TARGET_LATENCY_SECONDS', '2.0'))
+IMAP_MAX_RETRIES = int(os.getenv('IMAP_MAX_RETRIES', '5'))
+
+# IMAP transport (COMPRESS=DEFLATE when the server supports it, TLS session resumption on reconnect)
+IMAP_COMPRESSION = os.getenv('IMAP_COMPRESSION', 'true').lower() == 'true'
+TLS_SESSION_REUSE = os.getenv('TLS_SESSION_REUSE', 'true').lower() == 'true'
+
 # Email Filter Keywords
 # Emails with these keywords in subject will be processed
 FILTER_KEYWORDS = {
@@ -27,6 +38,22 @@ FILTER_KEYWORDS = {
     'Analysis': 'Reports'
 }
 
+# Backlog priority (weighted share of fetches per document type, then the within-type policy)
+# Policy keys, most significant first: allowlist (allowlisted senders), size (small first), age (oldest first)
+PRIORITY_ENABLED = os.getenv('PRIORITY_ENABLED', 'true').lower() == 'true'
+PRIORITY_TYPE_WEIGHTS = {
+    doc_type.strip(): int(weight)
+    for doc_type, weight in (
+        entry.split(':') for entry in
+        os.getenv('PRIORITY_TYPE_WEIGHTS', 'Invoices:8,Reports:2,Resumes:2,Others:1').split(',')
+        if entry.strip()
+    )
+}
+PRIORITY_SENDER_ALLOWLIST = [
+    entry for entry in os.getenv('PRIORITY_SENDER_ALLOWLIST', '').split(',') if entry.strip()
+]
+PRIORITY_POLICY = os.getenv('PRIORITY_POLICY', 'allowlist,size,age').split(',')
+
 # Base directory for downloaded documents
 BASE_DIR = Path(__file__).parent.parent
 DOWNLOAD_BASE_DIR = BASE_DIR / 'Downloads'
@@ -39,6 +66,67 @@ DOCUMENT_FOLDERS = {
     'Others': DOWNLOAD_BASE_DIR / 'Others'
 }
 
+# Folder layout for stored documents, relative to the DOCUMENT_FOLDERS entry
+# Fields: {type}, {yyyy}, {mm}, {dd} (e.g. '{type}/{yyyy}/{mm}' bounds directory sizes)
+# Run layout_migration.py after changing it to move existing documents
+DOCUMENT_LAYOUT = os.getenv('DOCUMENT_LAYOUT', '{type}')
+LAYOUT_MIGRATION_STATE_FILE = DOWNLOAD_BASE_DIR / '.layout_migration.json'
+
+# Document catalog (indexed record of every stored document)
+CATALOG_ENABLED = os.getenv('CATALOG_ENABLED', 'true').lower() == 'true'
+CATALOG_DB_FILE = DOWNLOAD_BASE_DIR / '.catalog.db'
+
+# Full-text search index over extracted document text
+SEARCH_INDEX_ENABLED = os.getenv('SEARCH_INDEX_ENABLED', 'true').lower() == 'true'
+SEARCH_INDEX_DB_FILE = DOWNLOAD_BASE_DIR / '.search_index.db'
+SEARCH_INDEX_WORKERS = int(os.getenv('SEARCH_INDEX_WORKERS', '2'))
+
+# Post-processing: derived artifacts (page_count, thumbnail, optionally text) for stored documents,
+# cached by content hash so repeated attachments are only processed once
+# ('text' duplicates the search index's extraction, so it is off by default)
+POST_PROCESSING_ENABLED = os.getenv('POST_PROCESSING_ENABLED', 'true').lower() == 'true'
+ARTIFACT_PROCESSORS = os.getenv('ARTIFACT_PROCESSORS', 'page_count,thumbnail').split(',')
+POST_PROCESSING_WORKERS = int(os.getenv('POST_PROCESSING_WORKERS', '2'))
+ARTIFACT_CACHE_DB_FILE = DOWNLOAD_BASE_DIR / '.artifacts.db'
+ARTIFACT_CACHE_MAX_MB = int(os.getenv('ARTIFACT_CACHE_MAX_MB', '512'))
+
+# Near-duplicate detection (re-scanned or re-exported documents)
+# NEAR_DUPLICATE_ACTION: 'flag' logs a warning and keeps the file, 'skip' drops it
+NEAR_DUPLICATE_ENABLED = os.getenv('NEAR_DUPLICATE_ENABLED', 'false').lower() == 'true'
+NEAR_DUPLICATE_THRESHOLD = float(os.getenv('NEAR_DUPLICATE_THRESHOLD', '0.9'))
+NEAR_DUPLICATE_IMAGE_DISTANCE = int(os.getenv('NEAR_DUPLICATE_IMAGE_DISTANCE', '6'))
+NEAR_DUPLICATE_ACTION = os.getenv('NEAR_DUPLICATE_ACTION', 'flag').lower()
+NEAR_DUPLICATE_DB_FILE = DOWNLOAD_BASE_DIR / '.near_duplicates.db'
+
+# Multi-instance coordination
+# Instances sharing COORDINATION_DB_FILE split the mailbox into PARTITION_COUNT UID partitions
+# held as leases; a lease not renewed within LEASE_TTL_SECONDS is taken over by another worker
+COORDINATION_ENABLED = os.getenv('COORDINATION_ENABLED', 'false').lower() == 'true'
+COORDINATION_DB_FILE = Path(os.getenv('COORDINATION_DB_FILE', str(DOWNLOAD_BASE_DIR / '.coordination.db')))
+WORKER_ID = os.getenv('WORKER_ID', f"{socket.gethostname()}-{os.getpid()}")
+PARTITION_COUNT = int(os.getenv('PARTITION_COUNT', '16'))
+LEASE_TTL_SECONDS = float(os.getenv('LEASE_TTL_SECONDS', '60'))
+
+# Write journal (crash-safe write path)
+# Stored documents are fsynced in groups of JOURNAL_BATCH_SIZE, or after JOURNAL_MAX_DELAY_MS;
+# processed hashes and read flags are only written once their documents are durable
+JOURNAL_DIR = DOWNLOAD_BASE_DIR / '.journal'
+JOURNAL_BATCH_SIZE = int(os.getenv('JOURNAL_BATCH_SIZE', '20'))
+JOURNAL_MAX_DELAY_MS = int(os.getenv('JOURNAL_MAX_DELAY_MS', '1000'))
+JOURNAL_FSYNC = os.getenv('JOURNAL_FSYNC', 'true').lower() == 'true'
+
+# Archive scrubber (archive_scrubber.py): hash verification state and hashing processes
+SCRUB_STATE_DB_FILE = DOWNLOAD_BASE_DIR / '.scrub.db'
+SCRUB_WORKERS = int(os.getenv('SCRUB_WORKERS', '2'))
+
+# Cold tier (cold_storage.py): documents older than COLD_TIER_AGE_DAYS and no larger than
+# COLD_TIER_MAX_FILE_KB are moved into compressed pack files (zstd if installed, else zlib)
+COLD_TIER_DIR = DOWNLOAD_BASE_DIR / '.packs'
+COLD_TIER_AGE_DAYS = float(os.getenv('COLD_TIER_AGE_DAYS', '365'))
+COLD_TIER_MAX_FILE_KB = int(os.getenv('COLD_TIER_MAX_FILE_KB', '1024'))
+COLD_TIER_PACK_MAX_MB = int(os.getenv('COLD_TIER_PACK_MAX_MB', '1024'))
+COLD_TIER_COMPRESSION = os.getenv('COLD_TIER_COMPRESSION', 'auto').lower()
+
 # Log file configuration
 LOG_DIR = BASE_DIR / 'logs'
 LOG_FILE = LOG_DIR / 'bot.log'
@@ -49,6 +137,14 @@ ALLOWED_EXTENSIONS = ['.pdf', '.docx', '.doc', '.xlsx', '.xls', '.txt', '.png',
 # Maximum attachment size in MB
 MAX_ATTACHMENT_SIZE_MB = 25
 
+# Memory budget for raw messages and decoded attachments (0 disables it)
+# Attachments that do not fit within MEMORY_SPILL_TIMEOUT_SECONDS are decoded to files in SPILL_DIR
+MEMORY_BUDGET_MB = int(os.getenv('MEMORY_BUDGET_MB', '256'))
+MEMORY_SPILL_TIMEOUT_SECONDS = float(os.getenv('MEMORY_SPILL_TIMEOUT_SECONDS', '0'))
+# Wait for budget before a message is fetched anyway, unreserved
+MEMORY_FETCH_TIMEOUT_SECONDS = float(os.getenv('MEMORY_FETCH_TIMEOUT_SECONDS', '30'))
+SPILL_DIR = DOWNLOAD_BASE_DIR / '.spool'
+
 # Create necessary directories
 def initialize_directories():
     """Create all required directories if they don't exist"""
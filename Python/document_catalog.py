@@ -0,0 +1,248 @@
+"""
+Document Catalog Module
+Records every stored document in an indexed SQLite catalog for fast lookup
+"""
+import sys
+import sqlite3
+import logging
+import argparse
+import threading
+from pathlib import Path
+from datetime import datetime
+from typing import List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class DocumentCatalog:
+    """
+    Indexed SQLite catalog of stored documents
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS documents (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            path TEXT NOT NULL UNIQUE,
+            doc_type TEXT NOT NULL,
+            sender TEXT NOT NULL COLLATE NOCASE,
+            email_date TEXT,
+            subject TEXT,
+            sha256 TEXT NOT NULL,
+            size INTEGER NOT NULL,
+            message_uid TEXT,
+            stored_at TEXT NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS idx_documents_type_date ON documents (doc_type, email_date);
+        CREATE INDEX IF NOT EXISTS idx_documents_sender_date ON documents (sender, email_date);
+        CREATE INDEX IF NOT EXISTS idx_documents_sha256 ON documents (sha256);
+        CREATE INDEX IF NOT EXISTS idx_documents_uid ON documents (message_uid);
+    """
+
+    def __init__(self, db_path: Path):
+        """
+        Open (or create) the catalog database
+
+        Args:
+            db_path: Path to the SQLite database file
+        """
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self.connection = sqlite3.connect(str(db_path), check_same_thread=False)
+        self.connection.row_factory = sqlite3.Row
+        # WAL lets readers (CLI, downstream pollers) query while the bot writes
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('PRAGMA synchronous=NORMAL')
+        self.connection.executescript(self.SCHEMA)
+        self.connection.commit()
+
+    def close(self):
+        """Close the catalog database safely"""
+        try:
+            self.connection.close()
+        except Exception as e:
+            logger.warning(f"Error closing document catalog: {e}")
+
+    def record_document(self, path: Path, doc_type: str, sender: str, email_date: Optional[str],
+                        subject: str, sha256: str, size: int, message_uid: Optional[str] = None) -> Optional[int]:
+        """
+        Record a stored document
+
+        Args:
+            path: Final path of the stored document
+            doc_type: Document type folder name
+            sender: Sanitized sender name
+            email_date: Parsed email date as YYYY-MM-DD
+            subject: Email subject line
+            sha256: SHA256 hash of the file content
+            size: File size in bytes
+            message_uid: Identifier of the source email
+
+        Returns:
+            Catalog row id, or None if recording failed
+        """
+        try:
+            with self._lock:
+                cursor = self.connection.execute(
+                    """
+                    INSERT OR REPLACE INTO documents
+                        (path, doc_type, sender, email_date, subject, sha256, size, message_uid, stored_at)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                    """,
+                    (str(path), doc_type, sender, email_date, subject, sha256, size, message_uid,
+                     datetime.now().isoformat(timespec='seconds'))
+                )
+                self.connection.commit()
+            logger.debug(f"Cataloged document {path} (id {cursor.lastrowid})")
+            return cursor.lastrowid
+        except Exception as e:
+            logger.error(f"Failed to catalog document {path}: {e}")
+            return None
+
+    def update_path(self, old_path: Path, new_path: Path):
+        """
+        Update the stored path of a document after it has been moved
+
+        Args:
+            old_path: Previous path of the document
+            new_path: New path of the document
+        """
+        try:
+            with self._lock:
+                self.connection.execute(
+                    'UPDATE documents SET path = ? WHERE path = ?', (str(new_path), str(old_path))
+                )
+                self.connection.commit()
+        except Exception as e:
+            logger.error(f"Failed to update catalog path {old_path}: {e}")
+
+    def find_documents(self, doc_type: Optional[str] = None, sender: Optional[str] = None,
+                       since: Optional[str] = None, until: Optional[str] = None,
+                       sha256: Optional[str] = None, after_id: int = 0,
+                       limit: int = 100) -> List[sqlite3.Row]:
+        """
+        Query the catalog using its indexes
+
+        Args:
+            doc_type: Restrict to a document type
+            sender: Sender name prefix (case-insensitive)
+            since: Earliest email date (YYYY-MM-DD, inclusive)
+            until: Latest email date (YYYY-MM-DD, inclusive)
+            sha256: Exact content hash
+            after_id: Only return rows with a larger id (for polling new documents)
+            limit: Maximum number of rows to return
+
+        Returns:
+            List of matching catalog rows ordered by id
+        """
+        # With a type or sender filter the unary '+' keeps the id keyset from driving the
+        # plan: a walk in rowid order would scan the whole table for a rare sender
+        if doc_type or sender:
+            clauses = ['+id > ?']
+        else:
+            clauses = ['id > ?']
+        params = [after_id]
+
+        if doc_type:
+            clauses.append('doc_type = ?')
+            params.append(doc_type)
+        if sender:
+            # Prefix match on a NOCASE column is a range search on idx_documents_sender_date
+            clauses.append("sender LIKE ? ESCAPE '\\'")
+            escaped = sender.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+            params.append(f"{escaped}%")
+        if since:
+            clauses.append('email_date >= ?')
+            params.append(since)
+        if until:
+            clauses.append('email_date <= ?')
+            params.append(until)
+        if sha256:
+            clauses.append('sha256 = ?')
+            params.append(sha256)
+
+        query = f"SELECT * FROM documents WHERE {' AND '.join(clauses)} ORDER BY id LIMIT ?"
+        params.append(limit)
+
+        with self._lock:
+            return self.connection.execute(query, params).fetchall()
+
+    def get_by_path(self, path: Path) -> Optional[sqlite3.Row]:
+        """
+        Look up a single document by its stored path
+
+        Args:
+            path: Path of the stored document
+
+        Returns:
+            Catalog row, or None if not cataloged
+        """
+        with self._lock:
+            return self.connection.execute(
+                'SELECT * FROM documents WHERE path = ?', (str(path),)
+            ).fetchone()
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """
+    Command line entry point for querying the catalog
+
+    Args:
+        argv: Command line arguments (defaults to sys.argv)
+
+    Returns:
+        Process exit code
+    """
+    import config
+
+    parser = argparse.ArgumentParser(description='Query the document catalog')
+    parser.add_argument('--db', type=Path, default=config.CATALOG_DB_FILE, help='Catalog database file')
+    parser.add_argument('--type', dest='doc_type', help='Document type (e.g. Invoices)')
+    parser.add_argument('--sender', help='Sender name prefix')
+    parser.add_argument('--since', help='Earliest email date (YYYY-MM-DD)')
+    parser.add_argument('--until', help='Latest email date (YYYY-MM-DD)')
+    parser.add_argument('--sha256', help='Exact content hash')
+    parser.add_argument('--after-id', type=int, default=0, help='Only documents cataloged after this id')
+    parser.add_argument('--limit', type=int, default=100, help='Maximum rows to print')
+    parser.add_argument('--locate', action='store_true',
+                        help='Add a column telling whether each document is on disk, packed, or missing')
+    args = parser.parse_args(argv)
+
+    if not args.db.exists():
+        print(f"ERROR: Catalog not found: {args.db}")
+        return 1
+
+    catalog = DocumentCatalog(args.db)
+    cold_storage = None
+    if args.locate and config.COLD_TIER_DIR.exists():
+        from cold_storage import ColdStorage
+        cold_storage = ColdStorage(config.COLD_TIER_DIR)
+    try:
+        rows = catalog.find_documents(
+            doc_type=args.doc_type,
+            sender=args.sender,
+            since=args.since,
+            until=args.until,
+            sha256=args.sha256,
+            after_id=args.after_id,
+            limit=args.limit
+        )
+        for row in rows:
+            columns = [str(row['id']), row['email_date'] or '', row['doc_type'], row['sender'], row['path']]
+            if args.locate:
+                if Path(row['path']).exists():
+                    columns.append('disk')
+                elif cold_storage and cold_storage.contains(Path(row['path'])):
+                    columns.append('packed')
+                else:
+                    columns.append('missing')
+            print('\t'.join(columns))
+    finally:
+        catalog.close()
+        if cold_storage:
+            cold_storage.close()
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
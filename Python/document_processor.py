@@ -2,11 +2,20 @@
 Document Processor Module
 Handles document renaming and organization into appropriate folders
 """
+import os
 import re
+import hashlib
 import logging
 from pathlib import Path
 from datetime import datetime
-from typing import Dict, Optional
+from typing import Callable, Dict, Optional
+
+import normalization
+from document_catalog import DocumentCatalog
+from search_index import SearchIndex
+from write_journal import JournalEntry
+from post_processing import PostProcessor
+from cold_storage import ColdStorage
 
 logger = logging.getLogger(__name__)
 
@@ -16,17 +25,77 @@ class DocumentProcessor:
     Processes and organizes documents based on type and metadata
     """
     
-    def __init__(self, document_folders: Dict[str, Path], filter_keywords: Dict[str, str]):
+    # Fields allowed in the folder layout template
+    LAYOUT_FIELDS = {'type', 'yyyy', 'mm', 'dd'}
+    
+    def __init__(self, document_folders: Dict[str, Path], filter_keywords: Dict[str, str],
+                 catalog: Optional[DocumentCatalog] = None,
+                 search_index: Optional[SearchIndex] = None,
+                 layout: str = '{type}',
+                 post_processor: Optional[PostProcessor] = None,
+                 cold_storage: Optional[ColdStorage] = None):
         """
         Initialize document processor
         
         Args:
             document_folders: Dictionary mapping folder names to Path objects
             filter_keywords: Dictionary mapping keywords to document types
+            catalog: Optional catalog in which stored documents are recorded
+            search_index: Optional full-text index that stored documents are queued into
+            layout: Folder layout template, e.g. '{type}/{yyyy}/{mm}'
+            post_processor: Optional worker pool generating derived artifacts for stored documents
+            cold_storage: Optional pack index; names of packed documents are never reused
         """
         self.document_folders = document_folders
         self.filter_keywords = filter_keywords
+        self.catalog = catalog
+        self.search_index = search_index
+        self.layout_segments = self._parse_layout(layout)
+        self.post_processor = post_processor
+        self.cold_storage = cold_storage
+    
+    @classmethod
+    def _parse_layout(cls, layout: str) -> list:
+        """
+        Validate a folder layout template
+        
+        Args:
+            layout: Template such as '{type}/{yyyy}/{mm}'
+            
+        Returns:
+            List of path segments below the document type folder
+            
+        Raises:
+            ValueError: If the template is malformed
+        """
+        segments = [segment for segment in layout.strip('/').split('/') if segment]
+        if not segments or segments[0] != '{type}':
+            raise ValueError(f"Document layout must start with '{{type}}': {layout!r}")
+        
+        for segment in segments[1:]:
+            fields = set(re.findall(r'{(\w+)}', segment))
+            unknown = fields - cls.LAYOUT_FIELDS
+            if unknown or 'type' in fields:
+                raise ValueError(f"Unsupported field in document layout {layout!r}: {segment!r}")
+        
+        return segments[1:]
+    
+    def layout_folder(self, doc_type: str, date_str: str) -> Path:
+        """
+        Build the folder for a document under the configured layout
         
+        Args:
+            doc_type: Type of document
+            date_str: Document date as YYYYMMDD
+            
+        Returns:
+            Target folder path
+        """
+        folder = self.document_folders.get(doc_type, self.document_folders['Others'])
+        for segment in self.layout_segments:
+            folder = folder / segment.format(yyyy=date_str[:4], mm=date_str[4:6], dd=date_str[6:8])
+        return folder
+    
     def determine_document_type(self, subject: str) -> str:
         """
         Determine document type based on email subject
@@ -60,17 +129,7 @@ class DocumentProcessor:
         Returns:
             Sanitized string safe for filenames
         """
-        # Remove or replace invalid characters
-        sanitized = re.sub(r'[<>:"/\\|?*\x00-\x1f]', '_', text)
-        
-        # Remove extra whitespace
-        sanitized = re.sub(r'\s+', '_', sanitized.strip())
-        
-        # Limit length
-        if len(sanitized) > max_length:
-            sanitized = sanitized[:max_length]
-        
-        return sanitized
+        return normalization.sanitize_filename(text, max_length)
     
     @staticmethod
     def extract_sender_name(from_field: str) -> str:
@@ -83,21 +142,11 @@ class DocumentProcessor:
         Returns:
             Sanitized sender name
         """
-        # Try to extract name from "Name <email@example.com>" format
-        match = re.search(r'^([^<]+)', from_field)
-        if match:
-            name = match.group(1).strip()
-            # Remove quotes if present
-            name = name.strip('"\'')
-        else:
-            # Use email address if name not found
-            email_match = re.search(r'[\w\.-]+@[\w\.-]+', from_field)
-            name = email_match.group(0).split('@')[0] if email_match else 'Unknown'
-        
-        return DocumentProcessor.sanitize_filename(name, max_length=30)
+        # Display name of "Name <email@example.com>", else the address local part (memoized)
+        return normalization.normalize_sender(from_field, max_length=30)
     
     def generate_new_filename(self, original_filename: str, doc_type: str, 
-                             sender: str, email_date: str) -> str:
+                             sender: str, email_date: str, date_str: Optional[str] = None) -> str:
         """
         Generate a meaningful filename based on document metadata
         Format: <DocumentType>_<Date>_<Sender>.<ext>
@@ -107,6 +156,7 @@ class DocumentProcessor:
             doc_type: Type of document (Invoices, Resumes, etc.)
             sender: Sender's name or email
             email_date: Email date string
+            date_str: Already resolved date as YYYYMMDD (email_date is not parsed then)
             
         Returns:
             New formatted filename
@@ -116,13 +166,8 @@ class DocumentProcessor:
         extension = file_path.suffix
         
         # Parse and format date
-        try:
-            # Try to parse email date (can be in various formats)
+        if date_str is None:
             date_str = self._parse_email_date(email_date)
-        except:
-            # Fallback to current date if parsing fails
-            date_str = datetime.now().strftime('%Y%m%d')
-            logger.warning(f"Could not parse email date '{email_date}', using current date")
         
         # Sanitize sender name
         sender_clean = self.sanitize_filename(sender, max_length=20)
@@ -134,28 +179,52 @@ class DocumentProcessor:
         return new_filename
     
     @staticmethod
-    def _parse_email_date(email_date: str) -> str:
+    def _parse_email_date(email_date: str, received: Optional[float] = None) -> str:
         """
         Parse email date string and format as YYYYMMDD
         
         Args:
             email_date: Date string from email header
+            received: Server arrival time (INTERNALDATE) used if the header is unparseable
             
         Returns:
             Formatted date string
         """
-        try:
-            # Email dates can be complex, try to extract basic date info
-            # Example: "Thu, 19 Dec 2025 10:30:00 +0000"
-            from email.utils import parsedate_to_datetime
-            dt = parsedate_to_datetime(email_date)
-            return dt.strftime('%Y%m%d')
-        except:
-            # Fallback to current date
-            return datetime.now().strftime('%Y%m%d')
+        date_str = normalization.parse_email_date(email_date)
+        if date_str:
+            return date_str
+        
+        if received:
+            logger.warning(f"Could not parse email date '{email_date}', using server arrival date")
+            return datetime.fromtimestamp(received).strftime('%Y%m%d')
+        
+        logger.warning(f"Could not parse email date '{email_date}', using current date")
+        return datetime.now().strftime('%Y%m%d')
+    
+    def document_date(self, email_metadata: dict) -> str:
+        """
+        Resolve the document date of an email once, remembering it in the metadata
+        Taken from the Date header, else the server arrival time, else the current date;
+        in the last case 'date_unknown' is set and the catalog stores no email date
+        
+        Args:
+            email_metadata: Dictionary containing email metadata (date, optional received)
+            
+        Returns:
+            Date formatted as YYYYMMDD
+        """
+        if 'document_date' not in email_metadata:
+            email_metadata['document_date'] = self._parse_email_date(
+                email_metadata['date'], email_metadata.get('received')
+            )
+            email_metadata['date_unknown'] = (normalization.parse_email_date(email_metadata['date']) is None
+                                              and not email_metadata.get('received'))
+        return email_metadata['document_date']
     
     def organize_document(self, file_path: Path, doc_type: str, 
-                         new_filename: str) -> Optional[Path]:
+                         new_filename: str, target_folder: Optional[Path] = None,
+                         journal_entry: Optional[JournalEntry] = None,
+                         on_reserved: Optional[Callable[[Path], None]] = None) -> Optional[Path]:
         """
         Move and rename document to appropriate folder
         
@@ -163,30 +232,54 @@ class DocumentProcessor:
             file_path: Current path of the file
             doc_type: Type of document
             new_filename: New name for the file
+            target_folder: Folder under the configured layout (defaults to the type folder)
+            journal_entry: Optional write-journal entry; the reserved name is recorded before the move
+            on_reserved: Optional callback given the reserved (final) path before the move
             
         Returns:
             New file path after organization, or None if failed
         """
         try:
             # Get target folder
-            target_folder = self.document_folders.get(doc_type, self.document_folders['Others'])
+            if target_folder is None:
+                target_folder = self.document_folders.get(doc_type, self.document_folders['Others'])
             target_folder.mkdir(parents=True, exist_ok=True)
             
             # Create new file path
             new_path = target_folder / new_filename
             
             # Handle duplicate filenames
+            # Reserve the name with an exclusive create so concurrent workers never share it
             counter = 1
             original_stem = new_path.stem
             original_suffix = new_path.suffix
             
-            while new_path.exists():
+            # A packed document keeps its name: it is still cataloged and read under it.
+            # The pack index is checked after the create, since packing indexes a file
+            # before it deletes it
+            while True:
+                try:
+                    open(new_path, 'xb').close()
+                    if not (self.cold_storage and self.cold_storage.contains(new_path)):
+                        break
+                    new_path.unlink()
+                except FileExistsError:
+                    pass
                 new_name = f"{original_stem}_{counter}{original_suffix}"
                 new_path = target_folder / new_name
                 counter += 1
             
-            # Move and rename file
-            file_path.rename(new_path)
+            if journal_entry:
+                journal_entry.record_rename(new_path)
+            if on_reserved:
+                on_reserved(new_path)
+            
+            # Move and rename file over the reserved placeholder
+            try:
+                os.replace(file_path, new_path)
+            except Exception:
+                new_path.unlink(missing_ok=True)
+                raise
             logger.info(f"Organized document: {file_path.name} -> {new_path}")
             
             return new_path
@@ -195,13 +288,102 @@ class DocumentProcessor:
             logger.error(f"Failed to organize document {file_path}: {e}")
             return None
     
-    def process_attachment(self, file_path: Path, email_metadata: dict) -> Optional[Path]:
+    @staticmethod
+    def _calculate_file_hash(file_path: Path) -> str:
+        """
+        Calculate SHA256 hash of a file on disk
+        
+        Args:
+            file_path: Path to the file
+            
+        Returns:
+            Hexadecimal hash string
+        """
+        sha256 = hashlib.sha256()
+        with open(file_path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                sha256.update(chunk)
+        return sha256.hexdigest()
+    
+    def _record_in_catalog(self, final_path: Path, doc_type: str, sender: str,
+                           email_metadata: dict, file_hash: str):
+        """
+        Record a stored document in the catalog
+        
+        Args:
+            final_path: Final path of the stored document
+            doc_type: Type of document
+            sender: Sanitized sender name
+            email_metadata: Dictionary containing email metadata
+            file_hash: SHA256 hash of the content
+        """
+        try:
+            date_str = self.document_date(email_metadata)
+            email_date = None
+            if not email_metadata.get('date_unknown'):
+                email_date = f"{date_str[:4]}-{date_str[4:6]}-{date_str[6:8]}"
+            self.catalog.record_document(
+                path=final_path,
+                doc_type=doc_type,
+                sender=sender,
+                email_date=email_date,
+                subject=email_metadata['subject'],
+                sha256=file_hash,
+                size=final_path.stat().st_size,
+                message_uid=email_metadata.get('uid')
+            )
+        except Exception as e:
+            logger.error(f"Failed to catalog document {final_path}: {e}")
+    
+    def _publish(self, final_path: Path, doc_type: str, sender: str,
+                 email_metadata: dict, file_hash: Optional[str]):
         """
-        Complete processing: determine type, rename, and organize
+        Record a stored document in the catalog and queue it for indexing and post-processing
+        
+        Args:
+            final_path: Final path of the stored document
+            doc_type: Type of document
+            sender: Sanitized sender name
+            email_metadata: Dictionary containing email metadata
+            file_hash: SHA256 hash of the content, computed if None
+        """
+        # Record in catalog
+        if self.catalog:
+            file_hash = file_hash or self._calculate_file_hash(final_path)
+            self._record_in_catalog(final_path, doc_type, sender, email_metadata, file_hash)
+        
+        # Queue for full-text indexing (extraction runs in the background)
+        if self.search_index:
+            self.search_index.submit(final_path, file_hash)
+        
+        # Queue post-processing hooks (thumbnails, page counts, ...)
+        if self.post_processor:
+            self.post_processor.submit(final_path, file_hash)
+    
+    def publish(self, details: dict):
+        """
+        Publish a document from its write-journal record (see process_attachment)
+        Safe to repeat: the catalog replaces the row for the path and the indexes are keyed by content
+        
+        Args:
+            details: Dictionary with path, type, sender, metadata and hash
+        """
+        self._publish(Path(details['path']), details['type'], details['sender'],
+                      details['metadata'], details['hash'])
+    
+    def process_attachment(self, file_path: Path, email_metadata: dict,
+                           file_hash: Optional[str] = None,
+                           journal_entry: Optional[JournalEntry] = None) -> Optional[Path]:
+        """
+        Complete processing: determine type, rename, organize, catalog, index, and post-process
         
         Args:
             file_path: Path to the attachment file
-            email_metadata: Dictionary containing email metadata (subject, from, date)
+            email_metadata: Dictionary containing email metadata (subject, from, date, uid)
+            file_hash: SHA256 hash of the attachment, if already known
+            journal_entry: Optional write-journal entry covering the rename; cataloging,
+                indexing and post-processing are recorded in it and run by the journal's
+                on_publish (publish) once it commits
             
         Returns:
             Final path of processed document, or None if failed
@@ -214,15 +396,35 @@ class DocumentProcessor:
             sender = self.extract_sender_name(email_metadata['from'])
             
             # Generate new filename
+            date_str = self.document_date(email_metadata)
             new_filename = self.generate_new_filename(
                 file_path.name,
                 doc_type,
                 sender,
-                email_metadata['date']
+                email_metadata['date'],
+                date_str=date_str
             )
             
             # Organize document
-            final_path = self.organize_document(file_path, doc_type, new_filename)
+            target_folder = self.layout_folder(doc_type, date_str)
+            final_path = self.organize_document(
+                file_path, doc_type, new_filename, target_folder, journal_entry=journal_entry
+            )
+            
+            if final_path:
+                # Under a journal, consumers only learn about the document once it is committed;
+                # a rolled-back document must never appear in the catalog or the index. The
+                # record lets recovery publish it if the run stops right after the commit.
+                if journal_entry:
+                    journal_entry.record_publish({
+                        'path': str(final_path),
+                        'type': doc_type,
+                        'sender': sender,
+                        'metadata': email_metadata,
+                        'hash': file_hash
+                    })
+                else:
+                    self._publish(final_path, doc_type, sender, email_metadata, file_hash)
             
             return final_path
             
@@ -2,22 +2,40 @@
 Email Reader Module
 Handles email connection via IMAP and fetches unread emails
 """
+import re
+import time
 import imaplib
 import email
 from email.header import decode_header
 from email.message import Message
 import logging
-from typing import List, Tuple, Optional
+from typing import Callable, Dict, Iterator, List, Tuple, Optional
+
+import pipeline_profiler
+from memory_budget import MemoryBudget
+from imap_transport import CompressingIMAP4_SSL
+from normalization import normalize_batch
+from throttle_controller import ThrottleController, is_throttle_response
+from priority_scheduler import MessageCandidate, PriorityScheduler
 
 logger = logging.getLogger(__name__)
 
+# Attributes fetched for every unread message before any body is downloaded
+CANDIDATE_FETCH_ITEMS = '(UID RFC822.SIZE INTERNALDATE BODY.PEEK[HEADER.FIELDS (SUBJECT FROM DATE)])'
+
+# Full message without setting \Seen; only the deferred mark_as_read flags a message,
+# after its documents are committed, so a crash leaves it unread and it is fetched again
+BODY_FETCH_ITEMS = '(UID BODY.PEEK[])'
+
 
 class EmailReader:
     """
     Manages email connection and retrieval operations
     """
     
-    def __init__(self, host: str, port: int, username: str, password: str):
+    def __init__(self, host: str, port: int, username: str, password: str,
+                 throttle: Optional[ThrottleController] = None,
+                 compression: bool = True, session_reuse: bool = True):
         """
         Initialize email reader with connection parameters
         
@@ -26,12 +44,20 @@ class EmailReader:
             port: IMAP server port
             username: Email account username
             password: Email account password
+            throttle: Controller for fetch batch size, pacing and retries
+            compression: Negotiate COMPRESS=DEFLATE when the server advertises it
+            session_reuse: Resume TLS sessions on reconnect instead of a full handshake
         """
         self.host = host
         self.port = port
         self.username = username
         self.password = password
         self.connection = None
+        self.throttle = throttle or ThrottleController()
+        self.compression = compression
+        self.session_reuse = session_reuse
+        self._needs_reconnect = False
+        self._received: Dict[str, float] = {}
         
     def connect(self) -> bool:
         """
@@ -42,8 +68,11 @@ class EmailReader:
         """
         try:
             logger.info(f"Connecting to {self.host}:{self.port}")
-            self.connection = imaplib.IMAP4_SSL(self.host, self.port)
+            self.connection = CompressingIMAP4_SSL(self.host, self.port, session_reuse=self.session_reuse)
             self.connection.login(self.username, self.password)
+            self.connection.remember_session()
+            if self.compression:
+                self.connection.enable_compression()
             logger.info("Email connection established successfully")
             return True
         except imaplib.IMAP4.error as e:
@@ -57,83 +86,347 @@ class EmailReader:
         """Close email connection safely"""
         try:
             if self.connection:
+                compression_summary = self.connection.compression_summary()
+                if compression_summary:
+                    logger.info(f"IMAP compression: {compression_summary}")
                 self.connection.close()
                 self.connection.logout()
                 logger.info("Email connection closed")
         except Exception as e:
             logger.warning(f"Error during disconnect: {e}")
     
-    def get_unread_emails(self, filter_keywords: List[str] = None) -> List[Tuple[str, object]]:
+    def _reconnect(self) -> bool:
         """
-        Fetch all unread emails, optionally filtered by subject keywords
+        Replace a dropped connection and reselect the inbox
+        UIDs stay valid across sessions, so work resumes where it stopped
+        
+        Returns:
+            bool: True if the new connection is ready
+        """
+        self.throttle.reconnects += 1
+        try:
+            if self.connection:
+                self.connection.shutdown()
+        except Exception:
+            pass
+        if not self.connect():
+            return False
+        try:
+            self.connection.select('INBOX')
+            return True
+        except Exception as e:
+            logger.error(f"Failed to reselect inbox: {e}")
+            return False
+    
+    def _uid_command(self, command: str, *args, messages: int = 1) -> Tuple[Optional[str], list]:
+        """
+        Run a UID command under the throttle controller, retrying throttled
+        responses and dropped connections with jittered backoff
+        A failed reconnect counts as a failed attempt and is retried on the next one
         
         Args:
-            filter_keywords: List of keywords to filter email subjects
+            command: UID command name ('fetch', 'store', ...)
+            *args: Command arguments
+            messages: Number of messages the command covers (for rate accounting)
+            
+        Returns:
+            Tuple of (status, data); status is None if all attempts failed
+        """
+        for attempt in range(self.throttle.max_retries):
+            self.throttle.pace()
+            if self._needs_reconnect:
+                if not self._reconnect():
+                    self.throttle.backoff(attempt)
+                    continue
+                self._needs_reconnect = False
+            
+            started = time.perf_counter()
+            try:
+                status, data = self.connection.uid(command, *args)
+            except (imaplib.IMAP4.abort, OSError) as e:
+                # BYE and dropped sockets surface as abort/OSError
+                self.throttle.record_throttle(f"connection lost: {e}")
+                self.throttle.backoff(attempt)
+                self._needs_reconnect = True
+                continue
+            except imaplib.IMAP4.error as e:
+                # Outside SELECTED state the session is not usable (e.g. a reconnect that
+                # failed at login); anything else is a real command error
+                if self.connection.state == 'SELECTED':
+                    raise
+                self.throttle.record_throttle(f"connection not ready ({self.connection.state}): {e}")
+                self.throttle.backoff(attempt)
+                self._needs_reconnect = True
+                continue
+            
+            if is_throttle_response(status, data):
+                self.throttle.record_throttle(f"{status} response")
+                self.throttle.backoff(attempt)
+                continue
+            
+            if status == 'OK':
+                self.throttle.record_success(time.perf_counter() - started, messages)
+            return status, data
+        
+        logger.error(f"UID {command.upper()} failed after {self.throttle.max_retries} attempts")
+        return None, []
+    
+    @staticmethod
+    def _parse_fetch_bodies(data: list) -> Dict[bytes, bytes]:
+        """
+        Split a multi-message FETCH response into message bodies
+        
+        Args:
+            data: Response data from UID FETCH ... (BODY.PEEK[]); the server answers with BODY[]
+            
+        Returns:
+            Dictionary mapping UID to raw message bytes
+        """
+        # Each message is a (prefix, literal) tuple; the UID may also arrive in the
+        # bytes that follow the literal
+        messages = []
+        for item in data:
+            if isinstance(item, tuple) and len(item) == 2:
+                messages.append([item[0], item[1]])
+            elif isinstance(item, bytes) and messages:
+                messages[-1][0] += item
+        
+        bodies = {}
+        for attributes, body in messages:
+            if not re.search(rb'(BODY\[\]|RFC822) ', attributes):
+                continue
+            match = re.search(rb'UID (\d+)', attributes)
+            if match:
+                bodies[match.group(1)] = body
+        return bodies
+    
+    def fetch_candidates(self, email_ids: List[bytes], chunk_size: int = 200) -> List[MessageCandidate]:
+        """
+        Fetch subject, sender, size and arrival time for messages, without downloading bodies
+        
+        Args:
+            email_ids: Message UIDs
+            chunk_size: UIDs per FETCH command
             
         Returns:
-            List of tuples containing (email_id, email_message_object)
+            List of message candidates in server order
+        """
+        candidates = []
+        for start in range(0, len(email_ids), chunk_size):
+            chunk = email_ids[start:start + chunk_size]
+            try:
+                with pipeline_profiler.stage('fetch'):
+                    status, data = self._uid_command('fetch', b','.join(chunk), CANDIDATE_FETCH_ITEMS, messages=0)
+            except imaplib.IMAP4.error as e:
+                # A BAD/NO reply for one chunk; the rest of the backlog is still fetched
+                logger.warning(f"Failed to fetch headers for {len(chunk)} emails: {e}")
+                continue
+            if status != 'OK':
+                logger.warning(f"Failed to fetch headers for {len(chunk)} emails")
+                continue
+            
+            # Each message is a (prefix, header literal) tuple, possibly followed by
+            # bytes holding attributes the server sent after the literal
+            messages = []
+            for item in data:
+                if isinstance(item, tuple) and len(item) == 2:
+                    messages.append([item[0], item[1]])
+                elif isinstance(item, bytes) and messages:
+                    messages[-1][0] += item
+            
+            for attributes, header_bytes in messages:
+                uid = re.search(rb'UID (\d+)', attributes)
+                if not uid:
+                    continue
+                size = re.search(rb'RFC822\.SIZE (\d+)', attributes)
+                internal_date = imaplib.Internaldate2tuple(attributes)
+                headers = email.message_from_bytes(header_bytes)
+                candidates.append(MessageCandidate(
+                    uid=uid.group(1),
+                    subject=self._decode_subject(headers.get('Subject', '')),
+                    sender=headers.get('From', ''),
+                    size=int(size.group(1)) if size else 0,
+                    received=time.mktime(internal_date) if internal_date else 0.0,
+                    date=headers.get('Date', '')
+                ))
+        return candidates
+    
+    def iter_unread_emails(self, filter_keywords: List[str] = None,
+                           uid_filter: Optional[Callable[[str], bool]] = None,
+                           memory_budget: Optional[MemoryBudget] = None,
+                           scheduler: Optional[PriorityScheduler] = None,
+                           budget_timeout: float = 30.0) -> Iterator[Tuple[str, Message]]:
         """
-        unread_emails = []
+        Yield unread emails one at a time, optionally filtered by subject keywords
+        Messages are addressed by UID, which stays stable across sessions and workers
+        
+        Headers are fetched first for the whole unread set; the keyword filter and the
+        scheduler work on those, so only matching bodies are downloaded, in priority order.
+        Bodies are fetched in batches sized by the throttle controller. With a memory budget,
+        the size of every message in a batch is reserved before the batch is downloaded (the
+        batch ends at the first message that does not fit), and each reservation is released
+        when the caller asks for the next message, so only messages that fit are held at once.
+        If the first message of a batch does not fit within budget_timeout, it is fetched
+        without a reservation (its attachments then spill to disk) instead of waiting forever.
+        
+        Args:
+            filter_keywords: List of keywords to filter email subjects
+            uid_filter: Optional predicate; UIDs it rejects are not fetched. It is applied to
+                the search result and again before each batch of bodies is downloaded
+            memory_budget: Optional budget covering raw message bytes
+            scheduler: Optional priority queue setting the fetch order (server order otherwise)
+            budget_timeout: Seconds to wait for budget for the first message of a batch
+            
+        Yields:
+            Tuples containing (email_uid, email_message_object)
+        """
+        matched = 0
         
         try:
             # Select inbox folder
             self.connection.select('INBOX')
             
             # Search for unread emails
-            status, messages = self.connection.search(None, 'UNSEEN')
+            status, messages = self._uid_command('search', None, 'UNSEEN', messages=0)
             
             if status != 'OK':
                 logger.error("Failed to search for unread emails")
-                return unread_emails
+                return
             
             email_ids = messages[0].split()
             logger.info(f"Found {len(email_ids)} unread emails")
             
-            for email_id in email_ids:
-                try:
-                    # Fetch email data
-                    status, msg_data = self.connection.fetch(email_id, '(RFC822)')
-                    
-                    if status != 'OK':
-                        logger.warning(f"Failed to fetch email {email_id}")
+            if uid_filter:
+                email_ids = [email_id for email_id in email_ids if uid_filter(email_id.decode())]
+                logger.info(f"{len(email_ids)} unread emails assigned to this worker")
+            
+            candidates = self.fetch_candidates(email_ids)
+            if filter_keywords:
+                keywords = [keyword.lower() for keyword in filter_keywords]
+                matching = []
+                for candidate in candidates:
+                    if any(keyword in candidate.subject.lower() for keyword in keywords):
+                        matching.append(candidate)
+                    else:
+                        logger.debug(f"Email {candidate.uid} filtered out: '{candidate.subject}'")
+                candidates = matching
+                logger.info(f"{len(candidates)} unread emails match the subject filter")
+            
+            if scheduler:
+                candidates = scheduler.order(candidates)
+            
+            # Parse each distinct sender and date of the backlog once; per-attachment lookups hit the caches
+            normalize_batch((candidate.sender, candidate.date) for candidate in candidates)
+            self._received = {candidate.uid.decode(): candidate.received for candidate in candidates}
+            
+            position = 0
+            while position < len(candidates):
+                # Build the next batch: the controller sets its length, the budget may cut it short
+                batch_start = position
+                batch = []
+                subjects = {}
+                reserved = {}
+                while position < len(candidates) and len(batch) < self.throttle.batch_size:
+                    candidate = candidates[position]
+                    email_id = candidate.uid
+                    size = candidate.size
+                    if uid_filter and not uid_filter(email_id.decode()):
+                        # Ownership is checked again before download (leases move while the
+                        # backlog is worked through); the message stays unread for its new owner
+                        logger.info(f"Lease for email {email_id.decode()} moved to another worker, skipping")
+                        position += 1
                         continue
-                    
-                    # Parse email message
-                    email_body = msg_data[0][1]
-                    email_message = email.message_from_bytes(email_body)
-                    
-                    # Decode subject
-                    subject = self._decode_subject(email_message.get('Subject', ''))
-                    
-                    # Filter by keywords if provided
-                    if filter_keywords:
-                        if not any(keyword.lower() in subject.lower() for keyword in filter_keywords):
-                            logger.debug(f"Email {email_id} filtered out: '{subject}'")
+                    if memory_budget and size:
+                        if memory_budget.acquire(size, timeout=budget_timeout if not batch else 0):
+                            reserved[email_id] = size
+                        elif batch:
+                            break
+                        else:
+                            logger.warning(f"Memory budget still full after {budget_timeout:.0f}s, "
+                                           f"fetching email {email_id.decode()} unreserved")
+                    batch.append(email_id)
+                    subjects[email_id] = candidate.subject
+                    position += 1
+                
+                if not batch:
+                    continue
+                
+                # Fetch email data
+                try:
+                    with pipeline_profiler.stage('fetch'):
+                        status, msg_data = self._uid_command(
+                            'fetch', b','.join(batch), BODY_FETCH_ITEMS, messages=len(batch)
+                        )
+                except imaplib.IMAP4.error as e:
+                    # A BAD/NO reply for this batch: retry its messages in smaller batches;
+                    # a message that fails on its own is skipped and stays unread
+                    for size in reserved.values():
+                        memory_budget.release(size)
+                    if len(batch) > 1:
+                        self.throttle.record_error(f"FETCH of {len(batch)} emails: {e}")
+                        if self.throttle.batch_size < len(batch):
+                            position = batch_start
                             continue
-                    
-                    logger.info(f"Processing email {email_id.decode()}: '{subject}'")
-                    unread_emails.append((email_id.decode(), email_message))
-                    
-                except Exception as e:
-                    logger.error(f"Error processing email {email_id}: {e}")
+                    logger.warning(f"Failed to fetch email(s) {b','.join(batch).decode()}: {e}")
                     continue
+                bodies = self._parse_fetch_bodies(msg_data) if status == 'OK' else {}
+                del msg_data
+                
+                for email_id in batch:
+                    email_message = None
+                    try:
+                        email_body = bodies.pop(email_id, None)
+                        if email_body is None:
+                            logger.warning(f"Failed to fetch email {email_id}")
+                            continue
+                        
+                        # Parse email message
+                        with pipeline_profiler.stage('message_from_bytes'):
+                            email_message = email.message_from_bytes(email_body)
+                        del email_body
+                        
+                        logger.info(f"Processing email {email_id.decode()}: '{subjects[email_id]}'")
+                        matched += 1
+                        yield email_id.decode(), email_message
+                        
+                    except Exception as e:
+                        logger.error(f"Error processing email {email_id}: {e}")
+                        continue
+                    finally:
+                        email_message = None
+                        if email_id in reserved:
+                            memory_budget.release(reserved.pop(email_id))
             
-            logger.info(f"Retrieved {len(unread_emails)} matching emails")
+            logger.info(f"Retrieved {matched} matching emails")
             
         except Exception as e:
             logger.error(f"Error fetching unread emails: {e}")
+    
+    def get_unread_emails(self, filter_keywords: List[str] = None,
+                          uid_filter: Optional[Callable[[str], bool]] = None) -> List[Tuple[str, object]]:
+        """
+        Fetch all unread emails, optionally filtered by subject keywords
         
-        return unread_emails
+        Args:
+            filter_keywords: List of keywords to filter email subjects
+            uid_filter: Optional predicate; UIDs it rejects are not fetched
+            
+        Returns:
+            List of tuples containing (email_uid, email_message_object)
+        """
+        return list(self.iter_unread_emails(filter_keywords, uid_filter=uid_filter))
     
     def mark_as_read(self, email_id: str):
         """
         Mark an email as read
         
         Args:
-            email_id: Email identifier to mark as read
+            email_id: Email UID to mark as read
         """
         try:
-            self.connection.store(email_id, '+FLAGS', '\\Seen')
+            status, _ = self._uid_command('store', email_id, '+FLAGS', '\\Seen', messages=0)
+            if status != 'OK':
+                raise imaplib.IMAP4.error(f"STORE returned {status}")
             logger.debug(f"Marked email {email_id} as read")
         except Exception as e:
             logger.warning(f"Failed to mark email {email_id} as read: {e}")
@@ -166,6 +459,18 @@ class EmailReader:
         
         return decoded_subject
     
+    def received_time(self, email_id: str) -> Optional[float]:
+        """
+        Server arrival time of a message from the current backlog
+        
+        Args:
+            email_id: Message UID
+            
+        Returns:
+            INTERNALDATE as a Unix timestamp, or None if unknown
+        """
+        return self._received.get(email_id) or None
+    
     @staticmethod
     def get_email_metadata(email_message: Message) -> dict:
         """
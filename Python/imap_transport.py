@@ -0,0 +1,191 @@
+"""
+IMAP Transport Module
+IMAP4_SSL connection with COMPRESS=DEFLATE (RFC 4978) and TLS session reuse
+"""
+import ssl
+import zlib
+import imaplib
+import logging
+import threading
+from typing import Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Bytes requested from the socket per read while decompressing
+READ_CHUNK_SIZE = 64 * 1024
+
+# Upper bound on the output of one inflate step, so a single compressed burst stays bounded
+INFLATE_CHUNK_SIZE = 256 * 1024
+
+# TLS sessions can only be resumed through the context that created them,
+# so every connection in the process shares one context and one session cache
+_shared_context = None
+_session_cache: Dict[Tuple[str, int], ssl.SSLSession] = {}
+_cache_lock = threading.Lock()
+
+
+def _get_shared_context() -> ssl.SSLContext:
+    """
+    Return the process-wide TLS context
+
+    Returns:
+        Default client SSLContext, created on first use
+    """
+    global _shared_context
+    with _cache_lock:
+        if _shared_context is None:
+            _shared_context = ssl.create_default_context()
+        return _shared_context
+
+
+class CompressingIMAP4_SSL(imaplib.IMAP4_SSL):
+    """
+    IMAP4_SSL that resumes cached TLS sessions and can switch the stream to DEFLATE
+    """
+
+    def __init__(self, host: str, port: int, session_reuse: bool = True, timeout: Optional[float] = None):
+        """
+        Connect to the server
+
+        Args:
+            host: IMAP server hostname
+            port: IMAP server port
+            session_reuse: Resume a cached TLS session for this server if one exists
+            timeout: Socket timeout in seconds
+        """
+        self.session_reuse = session_reuse
+        self._compressor = None
+        self._decompressor = None
+        # Inflated bytes not yet consumed start at _offset; the consumed prefix is dropped in bulk
+        self._inflated = bytearray()
+        self._offset = 0
+        self.wire_bytes_in = 0
+        self.plain_bytes_in = 0
+        super().__init__(host, port, ssl_context=_get_shared_context(), timeout=timeout)
+
+    def _create_socket(self, timeout):
+        """Open the TLS socket, offering a cached session for an abbreviated handshake"""
+        sock = imaplib.IMAP4._create_socket(self, timeout)
+        session = None
+        if self.session_reuse:
+            with _cache_lock:
+                session = _session_cache.get((self.host, self.port))
+        tls_sock = self.ssl_context.wrap_socket(sock, server_hostname=self.host, session=session)
+        if session is not None:
+            logger.debug(f"TLS session {'resumed' if tls_sock.session_reused else 'not resumed'} "
+                         f"for {self.host}:{self.port}")
+        return tls_sock
+
+    def remember_session(self):
+        """
+        Cache the current TLS session for later connections
+        TLS 1.3 delivers session tickets after the handshake, so call this after login
+        """
+        if not self.session_reuse:
+            return
+        session = getattr(self.sock, 'session', None)
+        if session is not None:
+            with _cache_lock:
+                _session_cache[(self.host, self.port)] = session
+
+    def enable_compression(self) -> bool:
+        """
+        Negotiate COMPRESS=DEFLATE if the server advertises it
+
+        Returns:
+            True if the stream is now compressed
+        """
+        if 'COMPRESS=DEFLATE' not in self.capabilities:
+            logger.debug("Server does not advertise COMPRESS=DEFLATE")
+            return False
+
+        imaplib.Commands.setdefault('COMPRESS', ('AUTH', 'SELECTED'))
+        typ, data = self._simple_command('COMPRESS', 'DEFLATE')
+        if typ != 'OK':
+            logger.warning(f"COMPRESS DEFLATE rejected: {data}")
+            return False
+
+        # Raw DEFLATE streams without zlib headers, as required by RFC 4978
+        self._compressor = zlib.compressobj(zlib.Z_DEFAULT_COMPRESSION, zlib.DEFLATED, -15)
+        self._decompressor = zlib.decompressobj(-15)
+        logger.info("IMAP compression (DEFLATE) enabled")
+        return True
+
+    def _fill(self) -> bool:
+        """
+        Inflate the next chunk, reading from the socket once pending input is used up
+
+        Returns:
+            False if the connection was closed
+        """
+        raw = self._decompressor.unconsumed_tail
+        if not raw:
+            raw = self.file.read1(READ_CHUNK_SIZE)
+            if not raw:
+                return False
+            self.wire_bytes_in += len(raw)
+        inflated = self._decompressor.decompress(raw, INFLATE_CHUNK_SIZE)
+        self.plain_bytes_in += len(inflated)
+
+        # Drop the consumed prefix once it is at least half the buffer (amortized linear)
+        if self._offset and self._offset * 2 >= len(self._inflated):
+            del self._inflated[:self._offset]
+            self._offset = 0
+        self._inflated += inflated
+        return True
+
+    def _take(self, end: int) -> bytes:
+        """Consume buffered bytes up to 'end'"""
+        data = bytes(self._inflated[self._offset:end])
+        self._offset = end
+        if self._offset == len(self._inflated):
+            # Fully consumed: release the buffer rather than holding a large literal
+            self._inflated = bytearray()
+            self._offset = 0
+        return data
+
+    def read(self, size: int) -> bytes:
+        """Read 'size' bytes from the server"""
+        if self._decompressor is None:
+            return super().read(size)
+
+        while len(self._inflated) - self._offset < size and self._fill():
+            pass
+        return self._take(min(self._offset + size, len(self._inflated)))
+
+    def readline(self) -> bytes:
+        """Read a line from the server"""
+        if self._decompressor is None:
+            return super().readline()
+
+        scanned = self._offset
+        while True:
+            newline = self._inflated.find(b'\n', scanned)
+            if newline >= 0:
+                return self._take(newline + 1)
+            if len(self._inflated) - self._offset > imaplib._MAXLINE:
+                break
+            scanned = len(self._inflated) - self._offset
+            if not self._fill():
+                break
+            scanned += self._offset
+        return self._take(len(self._inflated))
+
+    def send(self, data: bytes):
+        """Send data to the server"""
+        if self._compressor is not None:
+            data = self._compressor.compress(data) + self._compressor.flush(zlib.Z_SYNC_FLUSH)
+        super().send(data)
+
+    def compression_summary(self) -> Optional[str]:
+        """
+        Describe the bandwidth saved by compression
+
+        Returns:
+            One-line summary, or None if compression was not used
+        """
+        if self._decompressor is None or not self.plain_bytes_in:
+            return None
+        saved = 1 - self.wire_bytes_in / self.plain_bytes_in
+        return (f"received {self.wire_bytes_in / 1024:.1f} KB on the wire for "
+                f"{self.plain_bytes_in / 1024:.1f} KB of IMAP data ({saved:.0%} saved)")
@@ -0,0 +1,252 @@
+"""
+Layout Migration Module
+Moves existing documents into the configured folder layout, incrementally and resumably
+"""
+import os
+import re
+import sys
+import json
+import time
+import logging
+import argparse
+from pathlib import Path
+from datetime import datetime
+from typing import Iterator, List, Optional, Tuple
+
+from document_processor import DocumentProcessor
+from document_catalog import DocumentCatalog
+from search_index import SearchIndex
+from cold_storage import ColdStorage
+
+logger = logging.getLogger(__name__)
+
+# Dates embedded by DocumentProcessor.generate_new_filename: <Type>_<YYYYMMDD>_<Sender>
+FILENAME_DATE_PATTERN = re.compile(r'_(\d{8})_')
+
+
+class LayoutMigrator:
+    """
+    Moves documents whose folder does not match the configured layout
+    """
+
+    def __init__(self, document_processor: DocumentProcessor, state_file: Path,
+                 catalog: Optional[DocumentCatalog] = None, search_index: Optional[SearchIndex] = None):
+        """
+        Initialize layout migrator
+
+        Args:
+            document_processor: Processor configured with the target layout
+            state_file: File recording the in-flight move for crash recovery
+            catalog: Optional catalog whose paths are kept up to date
+            search_index: Optional search index whose paths are kept up to date
+        """
+        self.document_processor = document_processor
+        self.state_file = state_file
+        self.catalog = catalog
+        self.search_index = search_index
+
+    def _write_state(self, state: Optional[dict]):
+        """
+        Persist (or clear) the in-flight move record
+
+        Args:
+            state: Move record, or None to clear it
+        """
+        if state is None:
+            if self.state_file.exists():
+                self.state_file.unlink()
+            return
+
+        temp_file = self.state_file.with_suffix('.tmp')
+        with open(temp_file, 'w') as f:
+            json.dump(state, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_file, self.state_file)
+
+    def _update_references(self, old_path: Path, new_path: Path):
+        """
+        Point catalog and search index entries at a moved document
+
+        Args:
+            old_path: Previous path of the document
+            new_path: New path of the document
+        """
+        if self.catalog:
+            self.catalog.update_path(old_path, new_path)
+        if self.search_index:
+            self.search_index.update_path(old_path, new_path)
+
+    def recover(self):
+        """Finish bookkeeping for a move interrupted by a crash"""
+        if not self.state_file.exists():
+            return
+
+        try:
+            with open(self.state_file, 'r') as f:
+                state = json.load(f)
+            source, destination = Path(state['source']), Path(state['destination'])
+            if destination.exists() and not source.exists():
+                logger.info(f"Completing interrupted move: {source} -> {destination}")
+                self._update_references(source, destination)
+            elif destination.exists() and source.exists():
+                # Crashed between reserving the name and the move: drop the empty placeholder
+                destination.unlink()
+        except Exception as e:
+            logger.warning(f"Failed to recover migration state: {e}")
+
+        self._write_state(None)
+
+    def _document_date(self, file_path: Path) -> str:
+        """
+        Determine a document's date for the layout
+
+        Args:
+            file_path: Path to the document
+
+        Returns:
+            Date as YYYYMMDD (catalog, then filename, then modification time)
+        """
+        if self.catalog:
+            row = self.catalog.get_by_path(file_path)
+            if row and row['email_date']:
+                return row['email_date'].replace('-', '')
+
+        match = FILENAME_DATE_PATTERN.search(file_path.name)
+        if match:
+            return match.group(1)
+
+        return datetime.fromtimestamp(file_path.stat().st_mtime).strftime('%Y%m%d')
+
+    def _iter_misplaced(self, min_age_seconds: float) -> Iterator[Tuple[Path, str, Path]]:
+        """
+        Walk the document folders and yield documents outside their layout folder
+
+        Args:
+            min_age_seconds: Skip files modified more recently (may still be in use)
+
+        Yields:
+            Tuples of (file_path, doc_type, target_folder)
+        """
+        cutoff = time.time() - min_age_seconds
+        for doc_type, folder in self.document_processor.document_folders.items():
+            if not folder.exists():
+                continue
+            for directory, _, filenames in os.walk(folder):
+                for filename in filenames:
+                    if filename.startswith('.'):
+                        continue
+                    file_path = Path(directory) / filename
+                    try:
+                        if file_path.stat().st_mtime > cutoff:
+                            continue
+                        target_folder = self.document_processor.layout_folder(
+                            doc_type, self._document_date(file_path)
+                        )
+                    except FileNotFoundError:
+                        continue
+                    if file_path.parent != target_folder:
+                        yield file_path, doc_type, target_folder
+
+    def migrate(self, batch_size: int = 500, pause_seconds: float = 0.0,
+                max_files: Optional[int] = None, min_age_seconds: float = 60.0,
+                dry_run: bool = False) -> int:
+        """
+        Move misplaced documents into the configured layout
+        Safe to interrupt and re-run: documents already in place are skipped
+
+        Args:
+            batch_size: Number of moves between pauses
+            pause_seconds: Sleep between batches to limit impact on live ingestion
+            max_files: Stop after this many moves (None for no limit)
+            min_age_seconds: Skip files modified more recently than this
+            dry_run: Log planned moves without performing them
+
+        Returns:
+            Number of documents moved
+        """
+        self.recover()
+        moved = 0
+
+        for file_path, doc_type, target_folder in self._iter_misplaced(min_age_seconds):
+            if max_files is not None and moved >= max_files:
+                break
+
+            if dry_run:
+                logger.info(f"Would move: {file_path} -> {target_folder}")
+                moved += 1
+                continue
+
+            # The state names the reserved destination, which may carry a _N suffix
+            new_path = self.document_processor.organize_document(
+                file_path, doc_type, file_path.name, target_folder,
+                on_reserved=lambda reserved: self._write_state(
+                    {'source': str(file_path), 'destination': str(reserved)}
+                )
+            )
+            if new_path:
+                self._update_references(file_path, new_path)
+                moved += 1
+                if pause_seconds and moved % batch_size == 0:
+                    time.sleep(pause_seconds)
+            self._write_state(None)
+
+        logger.info(f"Layout migration moved {moved} documents")
+        return moved
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """
+    Command line entry point for migrating documents to the configured layout
+
+    Args:
+        argv: Command line arguments (defaults to sys.argv)
+
+    Returns:
+        Process exit code
+    """
+    import config
+
+    parser = argparse.ArgumentParser(description='Move stored documents into DOCUMENT_LAYOUT')
+    parser.add_argument('--batch-size', type=int, default=500, help='Moves between pauses')
+    parser.add_argument('--pause', type=float, default=0.0, help='Seconds to sleep between batches')
+    parser.add_argument('--max-files', type=int, help='Stop after this many moves')
+    parser.add_argument('--min-age', type=float, default=60.0, help='Skip files modified in the last N seconds')
+    parser.add_argument('--dry-run', action='store_true', help='Only log planned moves')
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='%(levelname)s - %(message)s')
+
+    catalog = DocumentCatalog(config.CATALOG_DB_FILE) if config.CATALOG_ENABLED else None
+    search_index = SearchIndex(config.SEARCH_INDEX_DB_FILE) if config.SEARCH_INDEX_ENABLED else None
+    cold_storage = ColdStorage(config.COLD_TIER_DIR) if config.COLD_TIER_DIR.exists() else None
+    document_processor = DocumentProcessor(
+        document_folders=config.DOCUMENT_FOLDERS,
+        filter_keywords=config.FILTER_KEYWORDS,
+        layout=config.DOCUMENT_LAYOUT,
+        cold_storage=cold_storage
+    )
+    migrator = LayoutMigrator(document_processor, config.LAYOUT_MIGRATION_STATE_FILE, catalog, search_index)
+
+    try:
+        moved = migrator.migrate(
+            batch_size=args.batch_size,
+            pause_seconds=args.pause,
+            max_files=args.max_files,
+            min_age_seconds=args.min_age,
+            dry_run=args.dry_run
+        )
+        print(f"Moved {moved} documents")
+    finally:
+        if search_index:
+            search_index.close()
+        if catalog:
+            catalog.close()
+        if cold_storage:
+            cold_storage.close()
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -5,6 +5,7 @@ Coordinates email reading, attachment handling, and document processing
 """
 import sys
 import logging
+import argparse
 from pathlib import Path
 
 # Import configuration
@@ -14,6 +15,19 @@ import config
 from email_reader import EmailReader
 from attachment_handler import AttachmentHandler
 from document_processor import DocumentProcessor
+from document_catalog import DocumentCatalog
+from search_index import SearchIndex
+from near_duplicate import NearDuplicateDetector
+from work_coordinator import WorkCoordinator
+from memory_budget import MemoryBudget
+from throttle_controller import ThrottleController
+from priority_scheduler import PriorityScheduler
+from write_journal import WriteJournal
+from artifact_cache import ArtifactCache
+from post_processing import PostProcessor, build_processors
+from cold_storage import ColdStorage
+import normalization
+import pipeline_profiler
 
 
 def setup_logging():
@@ -85,6 +99,16 @@ def process_emails():
     
     # Initialize components
     email_reader = None
+    catalog = None
+    search_index = None
+    near_duplicate_detector = None
+    coordinator = None
+    memory_budget = None
+    journal = None
+    artifact_cache = None
+    post_processor = None
+    cold_storage = None
+    total_emails = 0
     total_processed = 0
     total_saved = 0
     
@@ -95,7 +119,15 @@ def process_emails():
             host=config.EMAIL_HOST,
             port=config.EMAIL_PORT,
             username=config.EMAIL_USER,
-            password=config.EMAIL_PASSWORD
+            password=config.EMAIL_PASSWORD,
+            throttle=ThrottleController(
+                initial_batch=config.IMAP_INITIAL_BATCH,
+                max_batch=config.IMAP_MAX_BATCH,
+                target_latency=config.IMAP_TARGET_LATENCY_SECONDS,
+                max_retries=config.IMAP_MAX_RETRIES
+            ),
+            compression=config.IMAP_COMPRESSION,
+            session_reuse=config.TLS_SESSION_REUSE
         )
         
         # Step 2: Connect to email server
@@ -106,40 +138,127 @@ def process_emails():
         
         # Step 3: Fetch unread emails with filters
         logger.info("Step 3: Fetching unread emails")
+        uid_filter = None
+        if config.COORDINATION_ENABLED:
+            coordinator = WorkCoordinator(
+                db_path=config.COORDINATION_DB_FILE,
+                worker_id=config.WORKER_ID,
+                partitions=config.PARTITION_COUNT,
+                lease_ttl=config.LEASE_TTL_SECONDS
+            )
+            owned = coordinator.acquire(timeout=config.LEASE_TTL_SECONDS)
+            logger.info(f"Worker {config.WORKER_ID} holds partitions {sorted(owned)}")
+            uid_filter = coordinator.owns
+        if config.MEMORY_BUDGET_MB > 0:
+            memory_budget = MemoryBudget(config.MEMORY_BUDGET_MB * 1024 * 1024)
         filter_keywords = list(config.FILTER_KEYWORDS.keys())
-        unread_emails = email_reader.get_unread_emails(filter_keywords)
-        
-        if not unread_emails:
-            logger.info("No matching unread emails found")
-            return True
         
         # Step 4: Initialize Attachment Handler
         logger.info("Step 4: Initializing Attachment Handler")
+        if config.NEAR_DUPLICATE_ENABLED:
+            near_duplicate_detector = NearDuplicateDetector(
+                db_path=config.NEAR_DUPLICATE_DB_FILE,
+                threshold=config.NEAR_DUPLICATE_THRESHOLD,
+                image_distance=config.NEAR_DUPLICATE_IMAGE_DISTANCE
+            )
         attachment_handler = AttachmentHandler(
             download_base_dir=config.DOWNLOAD_BASE_DIR,
             allowed_extensions=config.ALLOWED_EXTENSIONS,
-            max_size_mb=config.MAX_ATTACHMENT_SIZE_MB
+            max_size_mb=config.MAX_ATTACHMENT_SIZE_MB,
+            near_duplicate_detector=near_duplicate_detector,
+            near_duplicate_action=config.NEAR_DUPLICATE_ACTION,
+            hash_claimer=coordinator.claim_hash if coordinator else None,
+            hash_releaser=coordinator.release_hash if coordinator else None,
+            memory_budget=memory_budget,
+            spill_dir=config.SPILL_DIR,
+            spill_timeout=config.MEMORY_SPILL_TIMEOUT_SECONDS
         )
         
         # Step 5: Initialize Document Processor
         logger.info("Step 5: Initializing Document Processor")
+        if config.CATALOG_ENABLED:
+            catalog = DocumentCatalog(config.CATALOG_DB_FILE)
+        if config.SEARCH_INDEX_ENABLED:
+            search_index = SearchIndex(config.SEARCH_INDEX_DB_FILE, workers=config.SEARCH_INDEX_WORKERS)
+        if config.POST_PROCESSING_ENABLED:
+            artifact_cache = ArtifactCache(
+                config.ARTIFACT_CACHE_DB_FILE, config.ARTIFACT_CACHE_MAX_MB * 1024 * 1024
+            )
+            post_processor = PostProcessor(
+                artifact_cache,
+                build_processors(config.ARTIFACT_PROCESSORS),
+                workers=config.POST_PROCESSING_WORKERS
+            )
+        if config.COLD_TIER_DIR.exists():
+            cold_storage = ColdStorage(config.COLD_TIER_DIR)
         document_processor = DocumentProcessor(
             document_folders=config.DOCUMENT_FOLDERS,
-            filter_keywords=config.FILTER_KEYWORDS
+            filter_keywords=config.FILTER_KEYWORDS,
+            catalog=catalog,
+            search_index=search_index,
+            layout=config.DOCUMENT_LAYOUT,
+            post_processor=post_processor,
+            cold_storage=cold_storage
+        )
+        
+        # Roll back documents a crashed run stored but never committed
+        # (they were never cataloged: that only happens after the commit)
+        def rollback(file_hash, paths):
+            if coordinator:
+                coordinator.release_hash(file_hash, any_owner=True)
+        
+        journal = WriteJournal(
+            journal_dir=config.JOURNAL_DIR,
+            worker_id=config.WORKER_ID,
+            on_durable=lambda hashes: attachment_handler.save_processed_hashes(hashes, fsync=config.JOURNAL_FSYNC),
+            on_publish=document_processor.publish,
+            batch_size=config.JOURNAL_BATCH_SIZE,
+            max_delay_ms=config.JOURNAL_MAX_DELAY_MS,
+            fsync=config.JOURNAL_FSYNC
+        )
+        journal.recover(
+            is_alive=coordinator.is_worker_alive if coordinator else None,
+            on_rollback=rollback
         )
         
         # Step 6: Process each email
-        logger.info(f"Step 6: Processing {len(unread_emails)} emails")
+        logger.info("Step 6: Processing emails")
+        scheduler = None
+        if config.PRIORITY_ENABLED:
+            scheduler = PriorityScheduler(
+                classify=document_processor.determine_document_type,
+                type_weights=config.PRIORITY_TYPE_WEIGHTS,
+                sender_allowlist=config.PRIORITY_SENDER_ALLOWLIST,
+                policy=config.PRIORITY_POLICY
+            )
+        # Headers are fetched up front; bodies are downloaded lazily, in priority order,
+        # as the loop below consumes them
+        unread_emails = email_reader.iter_unread_emails(
+            filter_keywords,
+            uid_filter=uid_filter,
+            memory_budget=memory_budget,
+            scheduler=scheduler,
+            budget_timeout=config.MEMORY_FETCH_TIMEOUT_SECONDS
+        )
         
         for email_id, email_message in unread_emails:
+            total_emails += 1
             try:
+                # Renew or rebalance leases; the reader checks ownership before each batch,
+                # and a message that was already downloaded is finished here either way
+                if coordinator:
+                    coordinator.heartbeat_if_due()
+                
                 # Get email metadata
                 metadata = EmailReader.get_email_metadata(email_message)
+                metadata['uid'] = email_id
+                metadata['received'] = email_reader.received_time(email_id)
                 logger.info(f"Processing email from: {metadata['from']}")
                 logger.info(f"Subject: {metadata['subject']}")
                 
                 # Extract attachments
-                attachments = attachment_handler.extract_attachments(email_message)
+                with pipeline_profiler.stage('extract_attachments'):
+                    attachments = attachment_handler.extract_attachments(email_message)
                 
                 if not attachments:
                     logger.info("No valid attachments found in this email")
@@ -149,44 +268,86 @@ def process_emails():
                 logger.info(f"Found {len(attachments)} attachment(s)")
                 
                 # Process each attachment
-                for filename, file_data in attachments:
-                    total_processed += 1
-                    
-                    # Determine document type
-                    doc_type = document_processor.determine_document_type(metadata['subject'])
-                    target_folder = config.DOCUMENT_FOLDERS.get(doc_type, config.DOCUMENT_FOLDERS['Others'])
-                    
-                    # Save attachment temporarily
-                    temp_path = attachment_handler.save_attachment(
-                        filename=filename,
-                        file_data=file_data,
-                        destination_folder=target_folder
-                    )
-                    
-                    if temp_path:
-                        # Process and organize document
-                        final_path = document_processor.process_attachment(temp_path, metadata)
+                try:
+                    for filename, file_data, file_hash in attachments:
+                        total_processed += 1
+                        journal_entry = journal.begin(file_hash, email_id, filename)
+                        final_path = None
+                        
+                        try:
+                            # Determine document type
+                            doc_type = document_processor.determine_document_type(metadata['subject'])
+                            target_folder = document_processor.layout_folder(
+                                doc_type, document_processor.document_date(metadata)
+                            )
+                            
+                            # Save attachment temporarily
+                            with pipeline_profiler.stage('save_attachment'):
+                                temp_path = attachment_handler.save_attachment(
+                                    filename=filename,
+                                    file_data=file_data,
+                                    destination_folder=target_folder,
+                                    journal_entry=journal_entry
+                                )
+                            
+                            if temp_path:
+                                # Process and organize document
+                                with pipeline_profiler.stage('process_attachment'):
+                                    final_path = document_processor.process_attachment(
+                                        temp_path, metadata, file_hash, journal_entry=journal_entry
+                                    )
+                                if not final_path:
+                                    logger.warning(f"Failed to organize: {filename}")
+                            else:
+                                logger.warning(f"Failed to save: {filename}")
+                        finally:
+                            if final_path:
+                                journal.finish(journal_entry)
+                            else:
+                                # Drop the hash claim so a re-delivery is stored again
+                                journal.abort(journal_entry)
+                                attachment_handler.release_claim(file_hash)
                         
                         if final_path:
                             total_saved += 1
                             logger.info(f"Successfully processed: {final_path.name}")
-                        else:
-                            logger.warning(f"Failed to organize: {filename}")
-                    else:
-                        logger.warning(f"Failed to save: {filename}")
+                finally:
+                    # Return memory budget and remove leftover spill files
+                    for _, file_data, _ in attachments:
+                        attachment_handler.release_attachment(file_data)
                 
-                # Mark email as read after processing
-                email_reader.mark_as_read(email_id)
+                # Mark email as read once its documents are committed
+                journal.defer(lambda uid=email_id: email_reader.mark_as_read(uid))
+                with pipeline_profiler.stage('journal_commit'):
+                    journal.commit_if_due()
                 
             except Exception as e:
                 logger.error(f"Error processing email {email_id}: {e}", exc_info=True)
                 continue
         
+        # Commit the last group of documents and flag their emails
+        journal.commit()
+        
+        if not total_emails:
+            logger.info("No matching unread emails found")
+            return True
+        
         # Step 7: Summary
         logger.info("=" * 60)
         logger.info("Processing Complete")
+        logger.info(f"Total emails processed: {total_emails}")
         logger.info(f"Total attachments processed: {total_processed}")
-        logger.info(f"Total documents saved: {total_saved}")
+        logger.info(f"Total documents saved: {total_saved} ({journal.commits} journal commits)")
+        logger.info(f"IMAP rates: {email_reader.throttle.summary()}")
+        logger.info(f"Header normalization: {normalization.cache_summary()}")
+        if post_processor:
+            # Summaries are final once the pool has drained
+            post_processor.wait()
+            logger.info(f"Artifacts: {post_processor.generated} generated, {post_processor.failed} failed; "
+                        f"cache {artifact_cache.summary()}")
+        if memory_budget:
+            logger.info(f"Peak budgeted memory: {memory_budget.peak / (1024 * 1024):.1f} MB "
+                        f"of {config.MEMORY_BUDGET_MB} MB")
         logger.info("=" * 60)
         
         return True
@@ -196,17 +357,51 @@ def process_emails():
         return False
         
     finally:
-        # Cleanup: Disconnect from email server
+        # Cleanup: Commit the journal, finish indexing, close catalog and disconnect from email server
+        if journal:
+            journal.close()
+        if search_index:
+            search_index.close()
+        if post_processor:
+            post_processor.close()
+        if artifact_cache:
+            artifact_cache.close()
+        if catalog:
+            catalog.close()
+        if cold_storage:
+            cold_storage.close()
+        if near_duplicate_detector:
+            near_duplicate_detector.close()
+        if coordinator:
+            coordinator.close()
         if email_reader:
             email_reader.disconnect()
             logger.info("Disconnected from email server")
 
 
+def parse_arguments():
+    """
+    Parse command line arguments
+    
+    Returns:
+        argparse.Namespace with the parsed options
+    """
+    parser = argparse.ArgumentParser(description='Email & Document Automation Bot')
+    parser.add_argument(
+        '--profile',
+        action='store_true',
+        help='Profile the run per pipeline stage and write reports to the logs folder'
+    )
+    return parser.parse_args()
+
+
 def main():
     """
     Main entry point
     Sets up logging, validates configuration, and runs the automation
     """
+    args = parse_arguments()
+    
     # Setup logging
     setup_logging()
     logger = logging.getLogger(__name__)
@@ -218,7 +413,15 @@ def main():
             sys.exit(1)
         
         # Run email processing
-        success = process_emails()
+        if args.profile:
+            profiler = pipeline_profiler.PipelineProfiler(config.LOG_DIR)
+            profiler.start()
+            try:
+                success = process_emails()
+            finally:
+                profiler.stop()
+        else:
+            success = process_emails()
         
         if success:
             print("SUCCESS: Automation completed successfully")
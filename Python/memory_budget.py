@@ -0,0 +1,128 @@
+"""
+Memory Budget Module
+Global byte budget for in-flight message data, with spill-to-disk for attachments
+"""
+import os
+import logging
+import threading
+import tempfile
+from pathlib import Path
+from contextlib import contextmanager
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+
+class MemoryBudget:
+    """
+    Counting semaphore over bytes: stages acquire before holding data and block when it runs out
+    """
+
+    def __init__(self, capacity_bytes: int):
+        """
+        Initialize memory budget
+
+        Args:
+            capacity_bytes: Total bytes that may be held at once
+        """
+        self.capacity_bytes = capacity_bytes
+        self.in_use = 0
+        self.peak = 0
+        self._condition = threading.Condition()
+
+    def _clamp(self, size: int) -> int:
+        """Limit a request to the capacity so oversized items can still run alone"""
+        return min(size, self.capacity_bytes)
+
+    def acquire(self, size: int, timeout: Optional[float] = None) -> bool:
+        """
+        Reserve bytes, blocking until enough budget is free
+
+        Args:
+            size: Number of bytes to reserve
+            timeout: Seconds to wait (None waits forever, 0 does not wait)
+
+        Returns:
+            True if the bytes were reserved, False on timeout
+        """
+        size = self._clamp(size)
+        with self._condition:
+            if not self._condition.wait_for(lambda: self.in_use + size <= self.capacity_bytes, timeout):
+                return False
+            self.in_use += size
+            self.peak = max(self.peak, self.in_use)
+            return True
+
+    def release(self, size: int):
+        """
+        Return previously reserved bytes
+
+        Args:
+            size: Number of bytes to release (as passed to acquire)
+        """
+        size = self._clamp(size)
+        with self._condition:
+            self.in_use = max(0, self.in_use - size)
+            self._condition.notify_all()
+
+    @contextmanager
+    def reserve(self, size: int):
+        """
+        Hold a reservation for the duration of a block
+
+        Args:
+            size: Number of bytes to reserve
+        """
+        self.acquire(size)
+        try:
+            yield
+        finally:
+            self.release(size)
+
+
+class SpilledAttachment:
+    """
+    Decoded attachment kept in a temporary file instead of memory
+    """
+
+    def __init__(self, path: Path, size: int, file_hash: str):
+        """
+        Initialize spilled attachment
+
+        Args:
+            path: Temporary file holding the decoded content
+            size: Content size in bytes
+            file_hash: SHA256 hash of the content
+        """
+        self.path = path
+        self.size = size
+        self.file_hash = file_hash
+
+    def __len__(self) -> int:
+        return self.size
+
+    def read_bytes(self) -> bytes:
+        """Load the content into memory"""
+        return self.path.read_bytes()
+
+    def discard(self):
+        """Delete the temporary file"""
+        try:
+            self.path.unlink(missing_ok=True)
+        except Exception as e:
+            logger.warning(f"Failed to remove spilled attachment {self.path}: {e}")
+
+
+def create_spill_file(spill_dir: Path):
+    """
+    Create a temporary file for a spilled attachment
+
+    Args:
+        spill_dir: Folder for spill files (same filesystem as the documents, so saving is a rename)
+
+    Returns:
+        Tuple of (open binary file object, Path)
+    """
+    spill_dir.mkdir(parents=True, exist_ok=True)
+    fd, name = tempfile.mkstemp(prefix='spill_', suffix='.part', dir=spill_dir)
+    return os.fdopen(fd, 'wb'), Path(name)
@@ -0,0 +1,329 @@
+"""
+Near-Duplicate Detection Module
+Similarity fingerprints (MinHash for text, dHash for images) looked up in an LSH index
+"""
+import io
+import re
+import random
+import sqlite3
+import hashlib
+import logging
+import threading
+from array import array
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+from text_extractor import extract_text
+
+logger = logging.getLogger(__name__)
+
+# Optional: perceptual hashing of images
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+# Optional: vectorized MinHash (pure Python otherwise)
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+IMAGE_EXTENSIONS = ['.png', '.jpg', '.jpeg']
+
+_MERSENNE_PRIME = (1 << 61) - 1
+_MAX_HASH = (1 << 32) - 1
+_WORD_PATTERN = re.compile(r'\w+')
+
+# Shingles hashed per numpy step, bounding the (num_perm x shingles) intermediate arrays
+_MINHASH_CHUNK = 4096
+
+
+def _optimal_bands(threshold: float, num_perm: int) -> Tuple[int, int]:
+    """
+    Choose LSH band/row split whose S-curve midpoint is closest to the threshold
+
+    Args:
+        threshold: Target Jaccard similarity
+        num_perm: Number of MinHash permutations
+
+    Returns:
+        Tuple of (bands, rows)
+    """
+    best = (num_perm, 1)
+    best_error = float('inf')
+    for rows in range(1, num_perm + 1):
+        if num_perm % rows:
+            continue
+        bands = num_perm // rows
+        error = abs((1.0 / bands) ** (1.0 / rows) - threshold)
+        if error < best_error:
+            best, best_error = (bands, rows), error
+    return best
+
+
+class NearDuplicateDetector:
+    """
+    Detects re-sent documents that are similar but not byte-identical
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS fingerprints (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            sha256 TEXT NOT NULL UNIQUE,
+            kind TEXT NOT NULL,
+            signature BLOB NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS lsh_buckets (
+            bucket TEXT NOT NULL,
+            fingerprint_id INTEGER NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS idx_lsh_buckets_bucket ON lsh_buckets (bucket);
+    """
+
+    IMAGE_BANDS = 8
+
+    def __init__(self, db_path: Path, threshold: float = 0.9, image_distance: int = 6,
+                 num_perm: int = 128, shingle_size: int = 5):
+        """
+        Open (or create) the similarity index
+
+        Args:
+            db_path: Path to the SQLite database file
+            threshold: Minimum estimated Jaccard similarity for text documents
+            image_distance: Maximum Hamming distance between 64-bit image hashes
+            num_perm: Number of MinHash permutations
+            shingle_size: Number of words per text shingle
+        """
+        self.threshold = threshold
+        # 8 bands of 8 bits: any pair within 7 bits shares at least one band
+        self.image_distance = min(image_distance, self.IMAGE_BANDS - 1)
+        self.num_perm = num_perm
+        self.shingle_size = shingle_size
+        self.bands, self.rows = _optimal_bands(threshold, num_perm)
+
+        # Fixed seed so signatures stay comparable across runs
+        rng = random.Random(1)
+        self._permutations = [
+            (rng.randint(1, _MERSENNE_PRIME - 1), rng.randint(0, _MERSENNE_PRIME - 1))
+            for _ in range(num_perm)
+        ]
+        if numpy is not None:
+            # 'a' is split at bit 29 so every product fits in 64 bits (see _minhash_numpy)
+            a = numpy.array([a for a, _ in self._permutations], dtype=numpy.uint64)[:, None]
+            self._a_high = a >> numpy.uint64(29)
+            self._a_low = a & numpy.uint64((1 << 29) - 1)
+            self._b = numpy.array([b for _, b in self._permutations], dtype=numpy.uint64)[:, None]
+
+        self._lock = threading.Lock()
+        self.connection = sqlite3.connect(str(db_path), check_same_thread=False)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.executescript(self.SCHEMA)
+        self.connection.commit()
+
+    def close(self):
+        """Close the similarity index safely"""
+        try:
+            self.connection.close()
+        except Exception as e:
+            logger.warning(f"Error closing near-duplicate index: {e}")
+
+    def _text_signature(self, text: str) -> Optional[List[int]]:
+        """
+        Compute a MinHash signature over word shingles
+
+        Args:
+            text: Extracted document text
+
+        Returns:
+            List of minimum hash values, or None if the text is empty
+        """
+        words = _WORD_PATTERN.findall(text.lower())
+        if not words:
+            return None
+
+        size = min(self.shingle_size, len(words))
+        shingle_hashes = {
+            int.from_bytes(hashlib.blake2b(' '.join(words[i:i + size]).encode(), digest_size=4).digest(), 'big')
+            for i in range(len(words) - size + 1)
+        }
+
+        if numpy is not None:
+            return self._minhash_numpy(shingle_hashes)
+        return [
+            min(((a * h + b) % _MERSENNE_PRIME) & _MAX_HASH for h in shingle_hashes)
+            for a, b in self._permutations
+        ]
+
+    def _minhash_numpy(self, shingle_hashes: set) -> List[int]:
+        """
+        Vectorized MinHash, bit-identical to the pure Python version
+
+        (a * h + b) mod p is computed exactly in uint64 for p = 2^61 - 1, h < 2^32:
+        a * h = a_high * h * 2^29 + a_low * h, and multiplying by 2^29 modulo a
+        Mersenne prime is a rotation within 61 bits.
+
+        Args:
+            shingle_hashes: 32-bit shingle hashes
+
+        Returns:
+            List of minimum hash values
+        """
+        prime = numpy.uint64(_MERSENNE_PRIME)
+        hashes = numpy.fromiter(shingle_hashes, dtype=numpy.uint64, count=len(shingle_hashes))
+        signature = numpy.full(self.num_perm, _MAX_HASH, dtype=numpy.uint64)
+        for start in range(0, len(hashes), _MINHASH_CHUNK):
+            h = hashes[start:start + _MINHASH_CHUNK][None, :]
+            high = (self._a_high * h) % prime
+            high = ((high & numpy.uint64(0xFFFFFFFF)) << numpy.uint64(29)) + (high >> numpy.uint64(32))
+            values = (high + self._a_low * h + self._b) % prime
+            numpy.minimum(signature, (values & numpy.uint64(_MAX_HASH)).min(axis=1), out=signature)
+        return signature.tolist()
+
+    @staticmethod
+    def _image_signature(data: bytes) -> Optional[int]:
+        """
+        Compute a 64-bit difference hash (dHash) of an image
+
+        Args:
+            data: Image content as bytes
+
+        Returns:
+            Perceptual hash, or None if Pillow is not installed
+        """
+        if Image is None:
+            logger.debug("Pillow not installed, skipping perceptual image hashing")
+            return None
+
+        with Image.open(io.BytesIO(data)) as image:
+            pixels = list(image.convert('L').resize((9, 8)).getdata())
+
+        value = 0
+        for row in range(8):
+            for col in range(8):
+                value = (value << 1) | (pixels[row * 9 + col] > pixels[row * 9 + col + 1])
+        return value
+
+    def fingerprint(self, filename: str, data: bytes) -> Optional[Tuple[str, object]]:
+        """
+        Compute the similarity fingerprint of an attachment
+
+        Args:
+            filename: Attachment filename (used for its extension)
+            data: File content as bytes
+
+        Returns:
+            Tuple of (kind, signature), or None if the format is not supported
+        """
+        extension = Path(filename).suffix.lower()
+        try:
+            if extension in IMAGE_EXTENSIONS:
+                signature = self._image_signature(data)
+                return ('image', signature) if signature is not None else None
+
+            text = extract_text(data, extension)
+            signature = self._text_signature(text) if text else None
+            return ('text', signature) if signature is not None else None
+        except Exception as e:
+            logger.warning(f"Failed to fingerprint {filename}: {e}")
+            return None
+
+    def _buckets(self, kind: str, signature) -> List[str]:
+        """
+        Compute the LSH bucket keys of a fingerprint
+
+        Args:
+            kind: Fingerprint kind ('text' or 'image')
+            signature: MinHash list or 64-bit image hash
+
+        Returns:
+            List of bucket keys
+        """
+        if kind == 'image':
+            return [f"i{band}:{(signature >> (band * 8)) & 0xFF}" for band in range(self.IMAGE_BANDS)]
+
+        buckets = []
+        for band in range(self.bands):
+            chunk = signature[band * self.rows:(band + 1) * self.rows]
+            digest = hashlib.blake2b(array('Q', chunk).tobytes(), digest_size=8).hexdigest()
+            buckets.append(f"t{band}:{digest}")
+        return buckets
+
+    def _similarity(self, kind: str, signature, stored: bytes) -> float:
+        """
+        Estimate similarity between a fingerprint and a stored signature
+
+        Args:
+            kind: Fingerprint kind ('text' or 'image')
+            signature: MinHash list or 64-bit image hash
+            stored: Stored signature blob
+
+        Returns:
+            Similarity in [0, 1]
+        """
+        if kind == 'image':
+            distance = bin(signature ^ int.from_bytes(stored, 'big')).count('1')
+            return 1.0 - distance / 64.0
+
+        other = array('Q')
+        other.frombytes(stored)
+        return sum(1 for x, y in zip(signature, other) if x == y) / self.num_perm
+
+    def find_match(self, kind: str, signature, exclude_hash: Optional[str] = None) -> Optional[Tuple[str, float]]:
+        """
+        Look up the most similar indexed document via LSH candidates
+
+        Args:
+            kind: Fingerprint kind ('text' or 'image')
+            signature: MinHash list or 64-bit image hash
+            exclude_hash: SHA256 of the document itself, never reported as its own duplicate
+
+        Returns:
+            Tuple of (sha256, similarity) for the best match above threshold, or None
+        """
+        buckets = self._buckets(kind, signature)
+        with self._lock:
+            candidates = self.connection.execute(
+                f"""
+                SELECT f.sha256, f.signature FROM fingerprints f
+                WHERE f.kind = ? AND f.id IN (
+                    SELECT fingerprint_id FROM lsh_buckets WHERE bucket IN ({','.join('?' * len(buckets))})
+                )
+                """,
+                [kind] + buckets
+            ).fetchall()
+
+        minimum = 1.0 - self.image_distance / 64.0 if kind == 'image' else self.threshold
+        best = None
+        for sha256, stored in candidates:
+            if sha256 == exclude_hash:
+                continue
+            similarity = self._similarity(kind, signature, stored)
+            if similarity >= minimum and (best is None or similarity > best[1]):
+                best = (sha256, similarity)
+        return best
+
+    def add(self, file_hash: str, kind: str, signature):
+        """
+        Add a fingerprint to the index
+
+        Args:
+            file_hash: SHA256 hash of the document
+            kind: Fingerprint kind ('text' or 'image')
+            signature: MinHash list or 64-bit image hash
+        """
+        blob = signature.to_bytes(8, 'big') if kind == 'image' else array('Q', signature).tobytes()
+        try:
+            with self._lock:
+                cursor = self.connection.execute(
+                    'INSERT OR IGNORE INTO fingerprints (sha256, kind, signature) VALUES (?, ?, ?)',
+                    (file_hash, kind, blob)
+                )
+                if cursor.rowcount:
+                    self.connection.executemany(
+                        'INSERT INTO lsh_buckets (bucket, fingerprint_id) VALUES (?, ?)',
+                        [(bucket, cursor.lastrowid) for bucket in self._buckets(kind, signature)]
+                    )
+                self.connection.commit()
+        except Exception as e:
+            logger.error(f"Failed to index fingerprint {file_hash}: {e}")
@@ -0,0 +1,128 @@
+"""
+Normalization Module
+Precompiled, memoized parsing of sender names, email dates and filename text
+"""
+import re
+import logging
+from functools import lru_cache
+from email.header import decode_header, make_header
+from email.utils import parseaddr, parsedate_to_datetime
+from typing import Iterable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Distinct From/Date values kept per cache; traffic comes from a small set of repeat senders
+CACHE_SIZE = 4096
+
+INVALID_FILENAME_CHARS = re.compile(r'[<>:"/\\|?*\x00-\x1f]')
+WHITESPACE = re.compile(r'\s+')
+
+
+def sanitize_filename(text: str, max_length: int = 50) -> str:
+    """
+    Sanitize text for use in filenames
+
+    Args:
+        text: Raw text to sanitize
+        max_length: Maximum length for the sanitized text
+
+    Returns:
+        Sanitized string safe for filenames
+    """
+    sanitized = INVALID_FILENAME_CHARS.sub('_', text)
+    sanitized = WHITESPACE.sub('_', sanitized.strip())
+    return sanitized[:max_length]
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def parse_sender(from_field: str) -> Tuple[str, str]:
+    """
+    Split a From header into display name and address
+
+    Args:
+        from_field: Email From header value
+
+    Returns:
+        Tuple of (decoded display name, address); either may be empty
+    """
+    name, address = parseaddr(from_field or '')
+    if '=?' in name:
+        # RFC 2047 encoded-word, e.g. =?utf-8?q?J=C3=B6rg?=
+        try:
+            name = str(make_header(decode_header(name)))
+        except Exception:
+            pass
+    return name.strip().strip('"\''), address
+
+
+def normalize_sender(from_field: str, max_length: int = 30) -> str:
+    """
+    Canonical, filename-safe sender name for a From header
+
+    Args:
+        from_field: Email From header value
+        max_length: Maximum length of the name
+
+    Returns:
+        Display name, or the local part of the address if there is none, or 'Unknown'
+    """
+    # lru_cache keys positional and keyword calls differently; always call it one way
+    return _normalize_sender(from_field, max_length)
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def _normalize_sender(from_field: str, max_length: int) -> str:
+    """Cached body of normalize_sender"""
+    name, address = parse_sender(from_field)
+    if not name:
+        name = address.split('@')[0] if address else 'Unknown'
+    return sanitize_filename(name, max_length=max_length)
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def parse_email_date(email_date: str) -> Optional[str]:
+    """
+    Parse an email Date header
+
+    Args:
+        email_date: Date string from email header (e.g. "Thu, 19 Dec 2025 10:30:00 +0000")
+
+    Returns:
+        Date formatted as YYYYMMDD, or None if the header cannot be parsed
+    """
+    try:
+        return parsedate_to_datetime(email_date).strftime('%Y%m%d')
+    except (TypeError, ValueError, IndexError, OverflowError):
+        return None
+
+
+def normalize_batch(headers: Iterable[Tuple[str, str]]) -> List[Tuple[str, Optional[str]]]:
+    """
+    Normalize the From and Date headers of a fetched batch at once
+
+    Each distinct value is parsed once and the caches are filled, so per-attachment
+    lookups for the batch are cache hits.
+
+    Args:
+        headers: (From header, Date header) pairs
+
+    Returns:
+        List of (sender name, YYYYMMDD date or None), in input order
+    """
+    headers = list(headers)
+    senders = {from_field: normalize_sender(from_field) for from_field in {h[0] for h in headers}}
+    dates = {email_date: parse_email_date(email_date) for email_date in {h[1] for h in headers}}
+    return [(senders[from_field], dates[email_date]) for from_field, email_date in headers]
+
+
+def cache_summary() -> str:
+    """
+    Describe cache effectiveness during the run
+
+    Returns:
+        One-line summary for the run log
+    """
+    sender = _normalize_sender.cache_info()
+    date = parse_email_date.cache_info()
+    return (f"senders {sender.hits} hits / {sender.misses} misses, "
+            f"dates {date.hits} hits / {date.misses} misses")
@@ -0,0 +1,285 @@
+"""
+Pipeline Profiler Module
+Per-stage CPU profiling, allocation tracking and stack sampling for a bot run
+"""
+import sys
+import time
+import pstats
+import cProfile
+import logging
+import threading
+import tracemalloc
+from pathlib import Path
+from datetime import datetime
+from collections import Counter
+from contextlib import nullcontext
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Profiler of the current run; None when profiling is off
+_active = None
+_NULL_STAGE = nullcontext()
+
+# Allocation sites are captured again only once the peak has grown by this factor;
+# a snapshot walks every live trace, so one per small new peak would dominate the run
+PEAK_SNAPSHOT_GROWTH = 1.25
+
+
+def stage(name: str):
+    """
+    Tag the enclosed block as a pipeline stage
+
+    Args:
+        name: Stage name (e.g. 'fetch', 'save_attachment')
+
+    Returns:
+        Context manager; a shared no-op when profiling is off
+    """
+    if _active is None:
+        return _NULL_STAGE
+    return _active.stage(name)
+
+
+class _StageStats:
+    """Accumulated measurements for one stage"""
+
+    def __init__(self):
+        self.calls = 0
+        self.wall_seconds = 0.0
+        self.cpu_seconds = 0.0
+        self.peak_bytes = 0
+        self.net_bytes = 0
+
+
+class _Stage:
+    """Context manager measuring one stage invocation"""
+
+    def __init__(self, profiler: 'PipelineProfiler', name: str):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        self.profiler._enter(self.name)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.profiler._exit()
+        return False
+
+
+class PipelineProfiler:
+    """
+    Wraps a run in cProfile, tracemalloc and a stack sampler, attributing all three to stages
+    """
+
+    ROOT_STAGE = 'run'
+
+    def __init__(self, output_dir: Path, top_n: int = 25, sample_interval: float = 0.005):
+        """
+        Initialize pipeline profiler
+
+        Args:
+            output_dir: Folder for the report files
+            top_n: Number of entries in the allocation and function reports
+            sample_interval: Seconds between stack samples
+        """
+        self.output_dir = output_dir
+        self.top_n = top_n
+        self.sample_interval = sample_interval
+
+        self.stats: Dict[str, _StageStats] = {}
+        self.profiles: Dict[str, cProfile.Profile] = {}
+        self.samples = Counter()
+        # Each frame: [name, wall_start, cpu_start, traced_start, peak_so_far]
+        self._stack: List[list] = []
+        self._peak_bytes = 0
+        self._peak_stage = None
+        self._snapshot = None
+        self._snapshot_bytes = 0
+        self._snapshot_stage = None
+        self._snapshotting = False
+        self._thread_id = None
+        self._sampler = None
+        self._stop_sampling = threading.Event()
+
+    def stage(self, name: str) -> _Stage:
+        """
+        Create a context manager for a stage
+
+        Args:
+            name: Stage name
+
+        Returns:
+            Stage context manager
+        """
+        return _Stage(self, name)
+
+    def _stage_path(self) -> str:
+        """Return the current stage nesting as 'run;fetch;...'"""
+        return ';'.join(frame[0] for frame in self._stack)
+
+    def _switch_profile(self, old: Optional[str], new: str):
+        """
+        Move cProfile collection from one stage to another
+
+        Args:
+            old: Stage being left (None at start)
+            new: Stage being entered
+        """
+        if old is not None:
+            self.profiles[old].disable()
+        if new not in self.profiles:
+            self.profiles[new] = cProfile.Profile()
+        self.profiles[new].enable()
+
+    def _enter(self, name: str):
+        """
+        Start measuring a stage
+
+        Args:
+            name: Stage name
+        """
+        traced, peak = tracemalloc.get_traced_memory()
+        parent = self._stack[-1] if self._stack else None
+        if parent:
+            parent[4] = max(parent[4], peak)
+        tracemalloc.reset_peak()
+
+        self._switch_profile(parent[0] if parent else None, name)
+        self._stack.append([name, time.perf_counter(), time.process_time(), traced, traced])
+
+    def _exit(self):
+        """Finish measuring the innermost stage"""
+        name, wall_start, cpu_start, traced_start, peak = self._stack[-1]
+        traced, current_peak = tracemalloc.get_traced_memory()
+        peak = max(peak, current_peak)
+
+        stats = self.stats.setdefault(name, _StageStats())
+        stats.calls += 1
+        stats.wall_seconds += time.perf_counter() - wall_start
+        stats.cpu_seconds += time.process_time() - cpu_start
+        stats.peak_bytes = max(stats.peak_bytes, peak)
+        stats.net_bytes += traced - traced_start
+
+        if peak > self._peak_bytes:
+            self._peak_bytes = peak
+            self._peak_stage = self._stage_path()
+            if peak >= self._snapshot_bytes * PEAK_SNAPSHOT_GROWTH:
+                self._take_snapshot(name, peak)
+
+        self._stack.pop()
+        parent = self._stack[-1] if self._stack else None
+        if parent:
+            parent[4] = max(parent[4], peak)
+            self._switch_profile(name, parent[0])
+        else:
+            self.profiles[name].disable()
+
+    def _take_snapshot(self, name: str, peak: int):
+        """
+        Capture allocation sites at the exit of a stage that raised the peak
+        The peak itself has passed by then, so these are the sites still live at stage exit.
+        The stage's timings are already recorded, and its CPU profile and the stack
+        sampler are paused, so the snapshot's own cost is not charged to the stage.
+
+        Args:
+            name: Stage being left
+            peak: Peak traced bytes during the stage
+        """
+        self.profiles[name].disable()
+        self._snapshotting = True
+        try:
+            self._snapshot = tracemalloc.take_snapshot()
+        finally:
+            self._snapshotting = False
+        self._snapshot_bytes = peak
+        self._snapshot_stage = self._peak_stage
+
+    def _sample_loop(self):
+        """Periodically record the main thread's stack, prefixed by its stage path"""
+        while not self._stop_sampling.wait(self.sample_interval):
+            frame = sys._current_frames().get(self._thread_id)
+            stage_path = self._stage_path()
+            if frame is None or not stage_path or self._snapshotting:
+                continue
+
+            functions = []
+            while frame is not None:
+                code = frame.f_code
+                functions.append(f"{Path(code.co_filename).name}:{code.co_name}")
+                frame = frame.f_back
+            self.samples[stage_path + ';' + ';'.join(reversed(functions))] += 1
+
+    def start(self):
+        """Start profiling the calling thread"""
+        global _active
+        tracemalloc.start(25)
+        self._thread_id = threading.get_ident()
+        self._enter(self.ROOT_STAGE)
+        self._sampler = threading.Thread(target=self._sample_loop, name='profiler-sampler', daemon=True)
+        self._sampler.start()
+        _active = self
+        logger.info("Profiling enabled")
+
+    def stop(self) -> List[Path]:
+        """
+        Stop profiling and write the reports
+
+        Returns:
+            Paths of the written report files
+        """
+        global _active
+        _active = None
+        while self._stack:
+            self._exit()
+        self._stop_sampling.set()
+        self._sampler.join()
+        tracemalloc.stop()
+
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        prefix = self.output_dir / f"profile_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
+        paths = [self._write_pstats(prefix), self._write_collapsed(prefix), self._write_report(prefix)]
+        for path in paths:
+            logger.info(f"Profile written: {path}")
+        return paths
+
+    def _write_pstats(self, prefix: Path) -> Path:
+        """Write the merged cProfile data of all stages"""
+        path = prefix.with_suffix('.pstats')
+        profiles = list(self.profiles.values())
+        merged = pstats.Stats(profiles[0])
+        for profile in profiles[1:]:
+            merged.add(profile)
+        merged.dump_stats(str(path))
+        return path
+
+    def _write_collapsed(self, prefix: Path) -> Path:
+        """Write sampled stacks in flamegraph collapsed format"""
+        path = prefix.with_suffix('.collapsed')
+        with open(path, 'w', encoding='utf-8') as f:
+            for stack, count in sorted(self.samples.items()):
+                f.write(f"{stack} {count}\n")
+        return path
+
+    def _write_report(self, prefix: Path) -> Path:
+        """Write per-stage totals, top functions per stage and top allocation sites"""
+        path = Path(f"{prefix}_report.txt")
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(f"{'Stage':<22}{'Calls':>8}{'Wall s':>10}{'CPU s':>10}{'Peak KB':>12}{'Net KB':>12}\n")
+            for name, stats in sorted(self.stats.items(), key=lambda item: -item[1].wall_seconds):
+                f.write(f"{name:<22}{stats.calls:>8}{stats.wall_seconds:>10.3f}{stats.cpu_seconds:>10.3f}"
+                        f"{stats.peak_bytes / 1024:>12.1f}{stats.net_bytes / 1024:>12.1f}\n")
+
+            for name, profile in self.profiles.items():
+                f.write(f"\n=== Top functions in stage '{name}' (cumulative) ===\n")
+                stats = pstats.Stats(profile, stream=f)
+                stats.sort_stats('cumulative').print_stats(self.top_n)
+
+            f.write(f"\n=== Top {self.top_n} allocation sites at exit of '{self._snapshot_stage}' "
+                    f"(stage peak {self._snapshot_bytes / 1024:.1f} KB; run peak "
+                    f"{self._peak_bytes / 1024:.1f} KB in '{self._peak_stage}') ===\n")
+            if self._snapshot is not None:
+                for statistic in self._snapshot.statistics('lineno')[:self.top_n]:
+                    f.write(f"{statistic}\n")
+        return path
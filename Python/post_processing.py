@@ -0,0 +1,242 @@
+"""
+Post-Processing Module
+Derived artifacts (text, page count, thumbnail) generated for stored documents in a worker pool
+"""
+import io
+import re
+import hashlib
+import logging
+import zipfile
+from abc import ABC, abstractmethod
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor, wait
+from typing import Iterable, List, Optional
+
+from artifact_cache import ArtifactCache
+from text_extractor import TEXT_EXTENSIONS, extract_text_from_file
+
+logger = logging.getLogger(__name__)
+
+# Optional: PDF page counts
+try:
+    from pypdf import PdfReader
+except ImportError:
+    PdfReader = None
+
+# Optional: image thumbnails
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+
+class ArtifactProcessor(ABC):
+    """
+    Base class for post-processors
+    Bump 'version' when the output format changes so cached artifacts are regenerated
+    """
+
+    name = ''
+    version = 1
+    extensions: List[str] = []
+
+    def applies_to(self, file_path: Path) -> bool:
+        """
+        Check whether the processor handles a document
+
+        Args:
+            file_path: Path to the document
+
+        Returns:
+            True if the processor should run
+        """
+        return file_path.suffix.lower() in self.extensions
+
+    @abstractmethod
+    def run(self, file_path: Path) -> Optional[bytes]:
+        """
+        Produce the artifact for a document
+
+        Args:
+            file_path: Path to the document
+
+        Returns:
+            Artifact bytes, or None if nothing could be derived
+        """
+
+
+class TextProcessor(ArtifactProcessor):
+    """
+    Plain text extraction (UTF-8)
+    The search index already stores document text, so this is not enabled by default
+    """
+
+    name = 'text'
+    extensions = TEXT_EXTENSIONS
+
+    def run(self, file_path: Path) -> Optional[bytes]:
+        text = extract_text_from_file(file_path)
+        return text.encode('utf-8') if text else None
+
+
+class PageCountProcessor(ArtifactProcessor):
+    """Number of pages of PDF and Word documents (ASCII integer)"""
+
+    name = 'page_count'
+    extensions = ['.pdf', '.docx']
+
+    def applies_to(self, file_path: Path) -> bool:
+        if file_path.suffix.lower() == '.pdf' and PdfReader is None:
+            return False
+        return super().applies_to(file_path)
+
+    def run(self, file_path: Path) -> Optional[bytes]:
+        if file_path.suffix.lower() == '.pdf':
+            pages = len(PdfReader(str(file_path)).pages)
+        else:
+            # Word stores the page count computed at last save in the extended properties
+            with zipfile.ZipFile(file_path) as archive:
+                try:
+                    properties = archive.read('docProps/app.xml').decode('utf-8', errors='ignore')
+                except KeyError:
+                    return None
+            match = re.search(r'<Pages>(\d+)</Pages>', properties)
+            if not match:
+                return None
+            pages = int(match.group(1))
+        return str(pages).encode('ascii')
+
+
+class ThumbnailProcessor(ArtifactProcessor):
+    """PNG thumbnail of image attachments (requires Pillow)"""
+
+    name = 'thumbnail'
+    extensions = ['.png', '.jpg', '.jpeg']
+    size = (256, 256)
+
+    def applies_to(self, file_path: Path) -> bool:
+        return Image is not None and super().applies_to(file_path)
+
+    def run(self, file_path: Path) -> Optional[bytes]:
+        with Image.open(file_path) as image:
+            image.thumbnail(self.size)
+            output = io.BytesIO()
+            image.convert('RGB').save(output, format='PNG')
+        return output.getvalue()
+
+
+# Processors selectable by name in ARTIFACT_PROCESSORS
+BUILTIN_PROCESSORS = {
+    processor.name: processor for processor in (TextProcessor, PageCountProcessor, ThumbnailProcessor)
+}
+
+
+def build_processors(names: Iterable[str]) -> List[ArtifactProcessor]:
+    """
+    Instantiate built-in processors by name
+
+    Args:
+        names: Processor names (unknown names are logged and skipped)
+
+    Returns:
+        List of processor instances
+    """
+    processors = []
+    for name in names:
+        name = name.strip()
+        if not name:
+            continue
+        if name not in BUILTIN_PROCESSORS:
+            logger.warning(f"Unknown post-processor: {name}")
+            continue
+        processors.append(BUILTIN_PROCESSORS[name]())
+    return processors
+
+
+class PostProcessor:
+    """
+    Runs registered processors for stored documents on a worker pool, through the artifact cache
+    """
+
+    def __init__(self, cache: ArtifactCache, processors: Iterable[ArtifactProcessor] = (), workers: int = 2):
+        """
+        Initialize post-processor
+
+        Args:
+            cache: Cache for processor outputs
+            processors: Processors to run for every stored document
+            workers: Number of worker threads
+        """
+        self.cache = cache
+        self.processors: List[ArtifactProcessor] = list(processors)
+        self.executor = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix='postproc')
+        self._pending = set()
+        self.generated = 0
+        self.failed = 0
+
+    def register(self, processor: ArtifactProcessor):
+        """
+        Add a processor to run for subsequently submitted documents
+
+        Args:
+            processor: Processor instance with a unique name
+        """
+        self.processors.append(processor)
+
+    def submit(self, file_path: Path, file_hash: Optional[str] = None):
+        """
+        Queue a stored document for post-processing
+
+        Args:
+            file_path: Path to the stored document
+            file_hash: SHA256 hash of the content, computed by the worker if None
+        """
+        processors = [processor for processor in self.processors if processor.applies_to(file_path)]
+        if not processors:
+            return
+        future = self.executor.submit(self._process, file_path, file_hash, processors)
+        self._pending.add(future)
+        future.add_done_callback(self._pending.discard)
+
+    def _process(self, file_path: Path, file_hash: Optional[str], processors: List[ArtifactProcessor]):
+        """
+        Generate missing artifacts for one document (runs on a worker thread)
+
+        Args:
+            file_path: Path to the document
+            file_hash: SHA256 hash of the content, if known
+            processors: Processors that apply to the document
+        """
+        try:
+            if file_hash is None:
+                file_hash = hashlib.sha256(file_path.read_bytes()).hexdigest()
+        except Exception as e:
+            logger.error(f"Failed to post-process {file_path}: {e}")
+            return
+
+        for processor in processors:
+            # Same content under another name costs only this lookup
+            if self.cache.contains(file_hash, processor.name, processor.version):
+                continue
+            try:
+                data = processor.run(file_path)
+            except Exception as e:
+                self.failed += 1
+                logger.warning(f"Post-processor {processor.name} failed for {file_path.name}: {e}")
+                continue
+            # "Nothing to derive" is cached too (as an empty artifact), so the same content
+            # costs only the lookup next time
+            self.cache.put(file_hash, processor.name, processor.version, data or b'')
+            if data:
+                self.generated += 1
+
+    def wait(self):
+        """Block until all queued documents have been processed"""
+        wait(list(self._pending))
+
+    def close(self):
+        """Wait for pending work and stop the worker pool"""
+        try:
+            self.executor.shutdown(wait=True)
+        except Exception as e:
+            logger.warning(f"Error stopping post-processor: {e}")
@@ -0,0 +1,173 @@
+"""
+Priority Scheduler Module
+Orders the unread backlog by document type, sender, size and age, with weighted fairness across types
+"""
+import heapq
+import logging
+from typing import Callable, Dict, Iterable, List, Optional
+
+from normalization import parse_sender
+
+logger = logging.getLogger(__name__)
+
+# Keys that may appear in the within-type ordering policy
+POLICY_KEYS = ('allowlist', 'size', 'age')
+
+
+class MessageCandidate:
+    """
+    Unread message known from its headers only, before the body is downloaded
+    """
+
+    def __init__(self, uid: bytes, subject: str, sender: str, size: int, received: float,
+                 date: str = ''):
+        """
+        Initialize candidate
+
+        Args:
+            uid: Message UID
+            subject: Decoded subject
+            sender: Raw From header
+            size: RFC822 size in bytes
+            received: Server arrival time (INTERNALDATE) as a Unix timestamp, 0 if unknown
+            date: Raw Date header
+        """
+        self.uid = uid
+        self.subject = subject
+        self.sender = sender
+        self.size = size
+        self.received = received
+        self.date = date
+        self.doc_type = 'Others'
+
+
+class PriorityScheduler:
+    """
+    Priority queue over message candidates
+
+    Each document type has its own heap ordered by the policy keys. Types are served by
+    smooth weighted round-robin, so a type with weight 8 gets eight messages for every one
+    of a type with weight 1, but no non-empty type waits indefinitely.
+    """
+
+    def __init__(self, classify: Callable[[str], str], type_weights: Dict[str, int],
+                 sender_allowlist: Iterable[str] = (), policy: Iterable[str] = POLICY_KEYS,
+                 default_weight: int = 1):
+        """
+        Initialize priority scheduler
+
+        Args:
+            classify: Function mapping a subject to a document type
+            type_weights: Share of fetches per document type
+            sender_allowlist: Addresses or '@domain' suffixes that go first within their type
+            policy: Within-type ordering keys, most significant first ('allowlist', 'size', 'age')
+            default_weight: Weight for types missing from type_weights
+
+        Raises:
+            ValueError: If the policy names an unknown key or a weight is not positive
+        """
+        self.policy = [key.strip().lower() for key in policy if key.strip()]
+        unknown = set(self.policy) - set(POLICY_KEYS)
+        if unknown:
+            raise ValueError(f"Unknown priority policy keys: {sorted(unknown)}")
+        if any(weight < 1 for weight in type_weights.values()) or default_weight < 1:
+            raise ValueError("Priority weights must be positive integers")
+
+        self.classify = classify
+        self.type_weights = type_weights
+        self.default_weight = default_weight
+        self.sender_allowlist = {entry.strip().lower() for entry in sender_allowlist if entry.strip()}
+        self._queues: Dict[str, list] = {}
+        self._credit: Dict[str, int] = {}
+        self._count = 0
+
+    def __len__(self) -> int:
+        return self._count
+
+    def is_allowlisted(self, sender: str) -> bool:
+        """
+        Check a From header against the allowlist
+
+        Args:
+            sender: Raw From header
+
+        Returns:
+            True if the address or its domain is allowlisted
+        """
+        address = parse_sender(sender)[1].lower()
+        if not address:
+            return False
+        domain = '@' + address.rpartition('@')[2]
+        return address in self.sender_allowlist or domain in self.sender_allowlist
+
+    def _sort_key(self, candidate: MessageCandidate) -> tuple:
+        """Build the within-type ordering key from the policy"""
+        key = []
+        for name in self.policy:
+            if name == 'allowlist':
+                key.append(0 if self.is_allowlisted(candidate.sender) else 1)
+            elif name == 'size':
+                key.append(candidate.size)
+            elif name == 'age':
+                key.append(candidate.received)
+        key.append(int(candidate.uid))
+        return tuple(key)
+
+    def push(self, candidate: MessageCandidate):
+        """
+        Classify a candidate and queue it
+
+        Args:
+            candidate: Message to schedule
+        """
+        candidate.doc_type = self.classify(candidate.subject)
+        queue = self._queues.setdefault(candidate.doc_type, [])
+        self._credit.setdefault(candidate.doc_type, 0)
+        heapq.heappush(queue, (self._sort_key(candidate), candidate))
+        self._count += 1
+
+    def pop(self) -> Optional[MessageCandidate]:
+        """
+        Take the next candidate by weighted round-robin across types
+
+        Returns:
+            Next candidate, or None if the queue is empty
+        """
+        active = [doc_type for doc_type, queue in self._queues.items() if queue]
+        if not active:
+            return None
+
+        total = 0
+        for doc_type in active:
+            weight = self.type_weights.get(doc_type, self.default_weight)
+            self._credit[doc_type] += weight
+            total += weight
+        chosen = max(active, key=lambda doc_type: self._credit[doc_type])
+        self._credit[chosen] -= total
+
+        self._count -= 1
+        return heapq.heappop(self._queues[chosen])[1]
+
+    def order(self, candidates: Iterable[MessageCandidate]) -> List[MessageCandidate]:
+        """
+        Schedule a candidate set and return it in fetch order
+
+        Args:
+            candidates: Messages to schedule
+
+        Returns:
+            Candidates in the order their bodies should be fetched
+        """
+        for candidate in candidates:
+            self.push(candidate)
+
+        counts = {doc_type: len(queue) for doc_type, queue in self._queues.items() if queue}
+        if counts:
+            logger.info("Backlog by type: " + ", ".join(
+                f"{doc_type} {count}" for doc_type, count in sorted(counts.items())
+            ))
+
+        ordered = []
+        while self._count:
+            ordered.append(self.pop())
+        return ordered
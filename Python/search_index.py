@@ -0,0 +1,298 @@
+"""
+Search Index Module
+Full-text index over extracted document text, backed by SQLite FTS5
+"""
+import os
+import sys
+import sqlite3
+import hashlib
+import logging
+import argparse
+import threading
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, wait
+from typing import Callable, Iterable, List, Optional, Tuple
+
+from cold_storage import ColdStorage
+from text_extractor import TEXT_EXTENSIONS, extract_text_from_file
+
+logger = logging.getLogger(__name__)
+
+
+class SearchIndex:
+    """
+    Full-text search index keyed by content hash, filled by a background worker pool
+    Text extraction (CPU-bound PDF parsing) runs in worker processes, so it does not
+    compete with ingestion for the interpreter lock
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS texts (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            sha256 TEXT NOT NULL UNIQUE
+        );
+        CREATE TABLE IF NOT EXISTS indexed_files (
+            path TEXT PRIMARY KEY,
+            sha256 TEXT NOT NULL,
+            size INTEGER NOT NULL,
+            mtime_ns INTEGER NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS idx_indexed_files_sha256 ON indexed_files (sha256);
+        CREATE VIRTUAL TABLE IF NOT EXISTS text_fts USING fts5(body);
+    """
+
+    def __init__(self, db_path: Path, workers: int = 2):
+        """
+        Open (or create) the search index
+
+        Args:
+            db_path: Path to the SQLite database file
+            workers: Number of background indexing threads and extraction processes
+        """
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self.connection = sqlite3.connect(str(db_path), check_same_thread=False)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('PRAGMA synchronous=NORMAL')
+        self.connection.executescript(self.SCHEMA)
+        self.connection.commit()
+        self.executor = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix='indexer')
+        self.extractors = ProcessPoolExecutor(max_workers=max(1, workers))
+        self._pending = set()
+
+    def wait(self):
+        """Block until all queued documents have been indexed"""
+        wait(list(self._pending))
+
+    def close(self):
+        """Wait for pending indexing work and close the index"""
+        try:
+            self.executor.shutdown(wait=True)
+            self.extractors.shutdown(wait=True)
+            self.connection.close()
+        except Exception as e:
+            logger.warning(f"Error closing search index: {e}")
+
+    def submit(self, file_path: Path, file_hash: Optional[str] = None):
+        """
+        Queue a document for background indexing
+
+        Args:
+            file_path: Path to the stored document
+            file_hash: SHA256 hash of the content, computed by the worker if None
+        """
+        if file_path.suffix.lower() not in TEXT_EXTENSIONS:
+            return
+        future = self.executor.submit(self._index_file, file_path, file_hash)
+        self._pending.add(future)
+        future.add_done_callback(self._pending.discard)
+
+    def _is_current(self, file_path: Path, stat: os.stat_result) -> bool:
+        """
+        Check whether a file is already indexed and unchanged
+
+        Args:
+            file_path: Path to the document
+            stat: Current stat result of the document
+
+        Returns:
+            True if the indexed size and mtime still match
+        """
+        with self._lock:
+            row = self.connection.execute(
+                'SELECT size, mtime_ns FROM indexed_files WHERE path = ?', (str(file_path),)
+            ).fetchone()
+        return row is not None and row == (stat.st_size, stat.st_mtime_ns)
+
+    def _has_text(self, file_hash: str) -> bool:
+        """
+        Check whether text for a content hash is already indexed
+
+        Args:
+            file_hash: SHA256 hash of the content
+
+        Returns:
+            True if the content has been indexed before
+        """
+        with self._lock:
+            row = self.connection.execute('SELECT 1 FROM texts WHERE sha256 = ?', (file_hash,)).fetchone()
+        return row is not None
+
+    def _index_file(self, file_path: Path, file_hash: Optional[str] = None):
+        """
+        Index a single document (runs on a worker thread)
+
+        Args:
+            file_path: Path to the document
+            file_hash: SHA256 hash of the content, if known
+        """
+        try:
+            stat = file_path.stat()
+            if self._is_current(file_path, stat):
+                return
+
+            if file_hash is None:
+                file_hash = hashlib.sha256(file_path.read_bytes()).hexdigest()
+
+            # Identical content is extracted and indexed only once
+            text = None
+            if not self._has_text(file_hash):
+                text = self.extractors.submit(extract_text_from_file, file_path).result()
+                if text is None:
+                    # Not recorded, so a later --reindex retries it (e.g. once pypdf is installed)
+                    with self._lock:
+                        self.connection.execute('DELETE FROM indexed_files WHERE path = ?', (str(file_path),))
+                        self.connection.commit()
+                    logger.debug(f"No text extracted from {file_path}, not indexed")
+                    return
+
+            with self._lock:
+                if text is not None:
+                    cursor = self.connection.execute(
+                        'INSERT OR IGNORE INTO texts (sha256) VALUES (?)', (file_hash,)
+                    )
+                    if cursor.rowcount:
+                        self.connection.execute(
+                            'INSERT INTO text_fts (rowid, body) VALUES (?, ?)', (cursor.lastrowid, text)
+                        )
+                self.connection.execute(
+                    'INSERT OR REPLACE INTO indexed_files (path, sha256, size, mtime_ns) VALUES (?, ?, ?, ?)',
+                    (str(file_path), file_hash, stat.st_size, stat.st_mtime_ns)
+                )
+                self.connection.commit()
+            logger.debug(f"Indexed document: {file_path}")
+        except Exception as e:
+            logger.error(f"Failed to index document {file_path}: {e}")
+
+    def update_path(self, old_path: Path, new_path: Path):
+        """
+        Update the indexed path of a document after it has been moved
+
+        Args:
+            old_path: Previous path of the document
+            new_path: New path of the document
+        """
+        try:
+            with self._lock:
+                self.connection.execute(
+                    'UPDATE indexed_files SET path = ? WHERE path = ?', (str(new_path), str(old_path))
+                )
+                self.connection.commit()
+        except Exception as e:
+            logger.error(f"Failed to update search index path {old_path}: {e}")
+
+    def reindex(self, folders: Iterable[Path], keep: Optional[Callable[[str], bool]] = None) -> int:
+        """
+        Incrementally re-index documents under the given folders
+        Unchanged files are skipped and entries for deleted files are removed
+
+        Args:
+            folders: Folders to walk
+            keep: Optional predicate for paths not on disk whose entries stay (e.g. packed documents)
+
+        Returns:
+            Number of files queued for indexing
+        """
+        seen = set()
+        queued = 0
+        for folder in folders:
+            if not folder.exists():
+                continue
+            for file_path in folder.rglob('*'):
+                if file_path.is_file() and file_path.suffix.lower() in TEXT_EXTENSIONS:
+                    seen.add(str(file_path))
+                    self.submit(file_path)
+                    queued += 1
+
+        with self._lock:
+            stale = [row[0] for row in self.connection.execute('SELECT path FROM indexed_files')
+                     if row[0] not in seen and not (keep and keep(row[0]))]
+            self.connection.executemany('DELETE FROM indexed_files WHERE path = ?', [(p,) for p in stale])
+            self.connection.commit()
+        if stale:
+            logger.info(f"Removed {len(stale)} deleted files from search index")
+        self._remove_orphaned_texts()
+        return queued
+
+    def _remove_orphaned_texts(self):
+        """Drop indexed text no longer referenced by any file"""
+        with self._lock:
+            orphans = self.connection.execute(
+                """
+                SELECT id FROM texts
+                WHERE sha256 NOT IN (SELECT sha256 FROM indexed_files)
+                """
+            ).fetchall()
+            for (text_id,) in orphans:
+                self.connection.execute('DELETE FROM text_fts WHERE rowid = ?', (text_id,))
+                self.connection.execute('DELETE FROM texts WHERE id = ?', (text_id,))
+            self.connection.commit()
+
+    def search(self, query: str, limit: int = 20) -> List[Tuple[str, str]]:
+        """
+        Search indexed document text
+
+        Args:
+            query: FTS5 query string
+            limit: Maximum number of results
+
+        Returns:
+            List of tuples containing (file_path, snippet), best matches first
+        """
+        with self._lock:
+            return self.connection.execute(
+                """
+                SELECT f.path, snippet(text_fts, 0, '[', ']', '...', 12)
+                FROM text_fts
+                JOIN texts t ON t.id = text_fts.rowid
+                JOIN indexed_files f ON f.sha256 = t.sha256
+                WHERE text_fts MATCH ?
+                ORDER BY text_fts.rank
+                LIMIT ?
+                """,
+                (query, limit)
+            ).fetchall()
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """
+    Command line entry point for searching and re-indexing
+
+    Args:
+        argv: Command line arguments (defaults to sys.argv)
+
+    Returns:
+        Process exit code
+    """
+    import config
+
+    parser = argparse.ArgumentParser(description='Search stored documents by content')
+    parser.add_argument('query', nargs='?', help='FTS5 query (e.g. "acme AND total")')
+    parser.add_argument('--db', type=Path, default=config.SEARCH_INDEX_DB_FILE, help='Index database file')
+    parser.add_argument('--reindex', action='store_true', help='Incrementally re-index all document folders')
+    parser.add_argument('--limit', type=int, default=20, help='Maximum results to print')
+    args = parser.parse_args(argv)
+
+    index = SearchIndex(args.db, workers=config.SEARCH_INDEX_WORKERS)
+    try:
+        if args.reindex:
+            cold_storage = ColdStorage(config.COLD_TIER_DIR) if config.COLD_TIER_DIR.exists() else None
+            try:
+                keep = (lambda path: cold_storage.contains(Path(path))) if cold_storage else None
+                queued = index.reindex(config.DOCUMENT_FOLDERS.values(), keep=keep)
+            finally:
+                if cold_storage:
+                    cold_storage.close()
+            index.wait()
+            print(f"Re-indexed {queued} documents")
+        if args.query:
+            for path, snippet in index.search(args.query, limit=args.limit):
+                print(f"{path}\t{snippet}")
+    finally:
+        index.close()
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
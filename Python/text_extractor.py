@@ -0,0 +1,118 @@
+"""
+Text Extractor Module
+Extracts plain text from supported document formats
+"""
+import io
+import logging
+import zipfile
+from pathlib import Path
+from typing import Optional
+from xml.etree import ElementTree
+
+logger = logging.getLogger(__name__)
+
+# Optional: text-layer PDF support
+try:
+    from pypdf import PdfReader
+except ImportError:
+    PdfReader = None
+
+WORD_NAMESPACE = '{http://schemas.openxmlformats.org/wordprocessingml/2006/main}'
+
+# Extensions for which text can be extracted
+TEXT_EXTENSIONS = ['.txt', '.docx', '.pdf']
+
+
+def _extract_txt(data: bytes) -> str:
+    """
+    Decode a plain text file
+
+    Args:
+        data: File content as bytes
+
+    Returns:
+        Decoded text
+    """
+    try:
+        return data.decode('utf-8')
+    except UnicodeDecodeError:
+        return data.decode('latin-1')
+
+
+def _extract_docx(data: bytes) -> str:
+    """
+    Extract paragraph text from a Word document
+
+    Args:
+        data: File content as bytes
+
+    Returns:
+        Document text, one paragraph per line
+    """
+    with zipfile.ZipFile(io.BytesIO(data)) as archive:
+        document_xml = archive.read('word/document.xml')
+
+    paragraphs = []
+    root = ElementTree.fromstring(document_xml)
+    for paragraph in root.iter(f'{WORD_NAMESPACE}p'):
+        text = ''.join(node.text or '' for node in paragraph.iter(f'{WORD_NAMESPACE}t'))
+        if text:
+            paragraphs.append(text)
+    return '\n'.join(paragraphs)
+
+
+def _extract_pdf(data: bytes) -> Optional[str]:
+    """
+    Extract the text layer of a PDF document
+
+    Args:
+        data: File content as bytes
+
+    Returns:
+        Document text, or None if PDF support is not installed
+    """
+    if PdfReader is None:
+        logger.debug("pypdf not installed, skipping PDF text extraction")
+        return None
+
+    reader = PdfReader(io.BytesIO(data))
+    return '\n'.join(page.extract_text() or '' for page in reader.pages)
+
+
+def extract_text(data: bytes, extension: str) -> Optional[str]:
+    """
+    Extract plain text from document content
+
+    Args:
+        data: File content as bytes
+        extension: File extension including the dot (e.g. '.pdf')
+
+    Returns:
+        Extracted text, or None if the format is unsupported or extraction failed
+    """
+    extension = extension.lower()
+    try:
+        if extension == '.txt':
+            return _extract_txt(data)
+        if extension == '.docx':
+            return _extract_docx(data)
+        if extension == '.pdf':
+            return _extract_pdf(data)
+    except Exception as e:
+        logger.warning(f"Text extraction failed for {extension} document: {e}")
+    return None
+
+
+def extract_text_from_file(file_path: Path) -> Optional[str]:
+    """
+    Extract plain text from a document on disk
+
+    Args:
+        file_path: Path to the document
+
+    Returns:
+        Extracted text, or None if the format is unsupported or extraction failed
+    """
+    if file_path.suffix.lower() not in TEXT_EXTENSIONS:
+        return None
+    return extract_text(file_path.read_bytes(), file_path.suffix)
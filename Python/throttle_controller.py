@@ -0,0 +1,154 @@
+"""
+Throttle Controller Module
+AIMD control of IMAP fetch batch size and command pacing, with jittered retry backoff
+"""
+import time
+import random
+import logging
+from typing import List
+
+logger = logging.getLogger(__name__)
+
+# Response text that providers use when rate limiting (Gmail, Outlook, Yahoo, Dovecot)
+THROTTLE_MARKERS = (b'THROTTL', b'LIMIT', b'OVERQUOTA', b'[UNAVAILABLE]', b'TOO MANY', b'TRY AGAIN')
+
+
+def is_throttle_response(status: str, data: List) -> bool:
+    """
+    Check whether an IMAP response signals rate limiting
+
+    Args:
+        status: Response status ('OK', 'NO', 'BAD', ...)
+        data: Response data items
+
+    Returns:
+        True if the server is asking the client to slow down
+    """
+    if status == 'OK':
+        return False
+    text = b' '.join(item if isinstance(item, bytes) else b'' for item in data or []).upper()
+    return any(marker in text for marker in THROTTLE_MARKERS)
+
+
+class ThrottleController:
+    """
+    Additive-increase / multiplicative-decrease controller for IMAP fetches
+
+    Two knobs are adjusted: the number of messages per FETCH command and the pause
+    between commands. Fast successful commands grow the batch by one and shrink the
+    pause; throttling responses, dropped connections and slow commands halve the batch
+    and double the pause.
+    """
+
+    def __init__(self, initial_batch: int = 5, min_batch: int = 1, max_batch: int = 50,
+                 target_latency: float = 2.0, max_retries: int = 5,
+                 base_backoff: float = 1.0, max_backoff: float = 60.0):
+        """
+        Initialize throttle controller
+
+        Args:
+            initial_batch: Messages per FETCH command at start
+            min_batch: Lower bound for the batch size
+            max_batch: Upper bound for the batch size
+            target_latency: Seconds per command above which the controller backs off
+            max_retries: Attempts per command before giving up
+            base_backoff: Initial retry backoff in seconds
+            max_backoff: Maximum retry backoff in seconds
+        """
+        self.batch_size = max(min_batch, min(initial_batch, max_batch))
+        self.min_batch = min_batch
+        self.max_batch = max_batch
+        self.target_latency = target_latency
+        self.max_retries = max_retries
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self.delay = 0.0
+
+        self.commands = 0
+        self.messages = 0
+        self.busy_seconds = 0.0
+        self.throttles = 0
+        self.retries = 0
+        self.reconnects = 0
+        self.peak_batch = self.batch_size
+
+    def pace(self):
+        """Sleep for the current inter-command pause"""
+        if self.delay:
+            time.sleep(self.delay)
+
+    def record_success(self, latency: float, messages: int = 1):
+        """
+        Record a completed command and adjust the rates
+
+        Args:
+            latency: Seconds the command took
+            messages: Number of messages it transferred
+        """
+        self.commands += 1
+        self.messages += messages
+        self.busy_seconds += latency
+
+        if latency > self.target_latency * 2:
+            self._decrease(f"slow command ({latency:.1f}s)")
+        elif latency <= self.target_latency:
+            self.batch_size = min(self.max_batch, self.batch_size + 1)
+            self.peak_batch = max(self.peak_batch, self.batch_size)
+            self.delay = max(0.0, self.delay - 0.1)
+
+    def record_throttle(self, reason: str):
+        """
+        Record a throttling signal and back off
+
+        Args:
+            reason: Description for the log
+        """
+        self.throttles += 1
+        self._decrease(reason)
+
+    def record_error(self, reason: str):
+        """
+        Record a failed command that is retried in smaller pieces
+        Only the batch is halved: an error reply is not a request to slow down
+
+        Args:
+            reason: Description for the log
+        """
+        self.batch_size = max(self.min_batch, self.batch_size // 2)
+        logger.warning(f"IMAP command failed ({reason}): batch size {self.batch_size}")
+
+    def _decrease(self, reason: str):
+        """Halve the batch size and double the pause"""
+        self.batch_size = max(self.min_batch, self.batch_size // 2)
+        self.delay = min(self.max_backoff, max(0.5, self.delay * 2))
+        logger.warning(f"IMAP throttling ({reason}): batch size {self.batch_size}, pause {self.delay:.1f}s")
+
+    def backoff(self, attempt: int) -> float:
+        """
+        Sleep before a retry using exponential backoff with full jitter
+        No retry follows the last attempt, so there is nothing to wait for
+
+        Args:
+            attempt: Zero-based attempt that just failed
+
+        Returns:
+            Seconds slept
+        """
+        if attempt + 1 >= self.max_retries:
+            return 0.0
+        self.retries += 1
+        seconds = random.uniform(0, min(self.max_backoff, self.base_backoff * (2 ** attempt)))
+        time.sleep(seconds)
+        return seconds
+
+    def summary(self) -> str:
+        """
+        Describe the rates reached during the run
+
+        Returns:
+            One-line summary for the run log
+        """
+        throughput = self.messages / self.busy_seconds if self.busy_seconds else 0.0
+        return (f"final batch {self.batch_size} (peak {self.peak_batch}), pause {self.delay:.1f}s, "
+                f"{self.commands} IMAP commands, {throughput:.1f} msg/s while fetching, "
+                f"{self.throttles} throttle events, {self.retries} retries, {self.reconnects} reconnects")
@@ -0,0 +1,278 @@
+"""
+Work Coordinator Module
+Lease-based partitioning of the mailbox UID space across several bot instances
+"""
+import time
+import sqlite3
+import logging
+from pathlib import Path
+from typing import Set
+
+logger = logging.getLogger(__name__)
+
+# Seconds between lease attempts while waiting for other workers to give back partitions
+ACQUIRE_POLL_SECONDS = 1.0
+
+
+class WorkCoordinator:
+    """
+    Splits message UIDs into hash partitions and hands them out as expiring leases
+    held in a shared SQLite store
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS workers (
+            worker_id TEXT PRIMARY KEY,
+            last_seen REAL NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS leases (
+            partition INTEGER PRIMARY KEY,
+            owner TEXT NOT NULL,
+            expires_at REAL NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS claimed_hashes (
+            sha256 TEXT PRIMARY KEY,
+            owner TEXT NOT NULL,
+            claimed_at REAL NOT NULL
+        );
+    """
+
+    def __init__(self, db_path: Path, worker_id: str, partitions: int = 16, lease_ttl: float = 60.0):
+        """
+        Open (or create) the shared coordination store
+
+        Args:
+            db_path: Path to the shared SQLite database file
+            worker_id: Unique identifier of this bot instance
+            partitions: Number of UID partitions
+            lease_ttl: Seconds a lease stays valid without renewal
+        """
+        self.worker_id = worker_id
+        self.partitions = partitions
+        self.lease_ttl = lease_ttl
+        self.owned: Set[int] = set()
+        self.fair_share = partitions
+        self.live_workers = 0
+        self._lease_expires_at = 0.0
+        self._last_heartbeat = 0.0
+
+        # Autocommit mode so every transaction is an explicit BEGIN IMMEDIATE
+        self.connection = sqlite3.connect(str(db_path), timeout=30, isolation_level=None)
+        self.connection.executescript(self.SCHEMA)
+
+        # Announce the worker before taking any lease, so workers starting together
+        # count each other and none takes the whole mailbox
+        self.connection.execute(
+            'INSERT OR REPLACE INTO workers (worker_id, last_seen) VALUES (?, ?)', (worker_id, time.time())
+        )
+
+    def close(self):
+        """Release all leases and close the store"""
+        try:
+            self.connection.execute('BEGIN IMMEDIATE')
+            self.connection.execute('DELETE FROM leases WHERE owner = ?', (self.worker_id,))
+            self.connection.execute('DELETE FROM workers WHERE worker_id = ?', (self.worker_id,))
+            self.connection.execute('COMMIT')
+            self.owned.clear()
+            self.connection.close()
+            logger.info(f"Worker {self.worker_id} released its leases")
+        except Exception as e:
+            logger.warning(f"Error releasing leases: {e}")
+
+    def heartbeat(self) -> Set[int]:
+        """
+        Renew owned leases, take over free or expired partitions up to a fair share,
+        and give back partitions beyond it
+        Shares are split by rank among the live workers, so they add up to the partition count
+
+        Returns:
+            Set of partitions currently owned by this worker
+        """
+        now = time.time()
+        expires_at = now + self.lease_ttl
+        self._last_heartbeat = now
+        try:
+            self.connection.execute('BEGIN IMMEDIATE')
+            self.connection.execute(
+                'INSERT OR REPLACE INTO workers (worker_id, last_seen) VALUES (?, ?)', (self.worker_id, now)
+            )
+            live_workers = [
+                worker_id for worker_id, in self.connection.execute(
+                    'SELECT worker_id FROM workers WHERE last_seen > ? ORDER BY worker_id', (now - self.lease_ttl,)
+                )
+            ]
+            rank = live_workers.index(self.worker_id)
+            fair_share = (self.partitions // len(live_workers)
+                          + (1 if rank < self.partitions % len(live_workers) else 0))
+
+            leases = {
+                partition: (owner, lease_expires)
+                for partition, owner, lease_expires in self.connection.execute(
+                    'SELECT partition, owner, expires_at FROM leases'
+                )
+            }
+            owned = sorted(p for p, (owner, lease_expires) in leases.items()
+                           if owner == self.worker_id and lease_expires > now)
+
+            # Give back the excess so newly started workers can pick it up
+            for partition in owned[fair_share:]:
+                self.connection.execute(
+                    'DELETE FROM leases WHERE partition = ? AND owner = ?', (partition, self.worker_id)
+                )
+            owned = owned[:fair_share]
+
+            for partition in range(self.partitions):
+                if len(owned) >= fair_share:
+                    break
+                lease = leases.get(partition)
+                if lease is None or lease[1] <= now:
+                    if lease is not None and lease[0] != self.worker_id:
+                        logger.info(f"Taking over expired partition {partition} from {lease[0]}")
+                    owned.append(partition)
+
+            self.connection.executemany(
+                'INSERT OR REPLACE INTO leases (partition, owner, expires_at) VALUES (?, ?, ?)',
+                [(partition, self.worker_id, expires_at) for partition in owned]
+            )
+            self.connection.execute('COMMIT')
+
+            self.owned = set(owned)
+            self.fair_share = fair_share
+            self.live_workers = len(live_workers)
+            self._lease_expires_at = expires_at
+            logger.debug(f"Worker {self.worker_id} owns partitions {sorted(self.owned)}")
+        except Exception as e:
+            logger.error(f"Failed to renew leases: {e}")
+            if self.connection.in_transaction:
+                self.connection.execute('ROLLBACK')
+            # Without a confirmed renewal the leases may be taken over
+            if time.time() >= self._lease_expires_at:
+                self.owned = set()
+
+        return self.owned
+
+    def heartbeat_if_due(self):
+        """
+        Renew leases once a third of the TTL is left, and rebalance as soon as a worker
+        starts or stops, or while this worker holds less than its share
+        Cheap enough to call before every fetch
+        """
+        now = time.time()
+        if now >= self._lease_expires_at - self.lease_ttl / 3:
+            self.heartbeat()
+            return
+        if len(self.owned) < self.fair_share and now - self._last_heartbeat >= ACQUIRE_POLL_SECONDS:
+            self.heartbeat()
+            return
+        try:
+            live_workers = self.connection.execute(
+                'SELECT COUNT(*) FROM workers WHERE last_seen > ?', (now - self.lease_ttl,)
+            ).fetchone()[0]
+        except Exception as e:
+            logger.error(f"Failed to count live workers: {e}")
+            return
+        if live_workers != self.live_workers:
+            self.heartbeat()
+
+    def acquire(self, timeout: float) -> Set[int]:
+        """
+        Take this worker's first leases, waiting for running workers to give back
+        their excess (they do so before their next fetch)
+
+        Args:
+            timeout: Seconds to wait for the fair share; leases of a worker that stopped
+                renewing expire after the TTL, so the TTL is a sensible bound
+
+        Returns:
+            Set of partitions owned by this worker
+        """
+        deadline = time.time() + timeout
+        owned = self.heartbeat()
+        while len(owned) < self.fair_share and time.time() < deadline:
+            time.sleep(ACQUIRE_POLL_SECONDS)
+            owned = self.heartbeat()
+        return owned
+
+    def partition_of(self, uid: str) -> int:
+        """
+        Map a message UID to its partition
+
+        Args:
+            uid: Message UID
+
+        Returns:
+            Partition number
+        """
+        return int(uid) % self.partitions
+
+    def owns(self, uid: str) -> bool:
+        """
+        Check whether this worker currently holds the lease for a message
+
+        Args:
+            uid: Message UID
+
+        Returns:
+            True if the message's partition is leased to this worker and not expired
+        """
+        return time.time() < self._lease_expires_at and self.partition_of(uid) in self.owned
+
+    def claim_hash(self, file_hash: str) -> bool:
+        """
+        Atomically claim an attachment hash across all workers
+
+        Args:
+            file_hash: SHA256 hash of the attachment
+
+        Returns:
+            True if this worker claimed it (or the store is unavailable),
+            False if another worker already claimed it
+        """
+        try:
+            cursor = self.connection.execute(
+                'INSERT OR IGNORE INTO claimed_hashes (sha256, owner, claimed_at) VALUES (?, ?, ?)',
+                (file_hash, self.worker_id, time.time())
+            )
+            return cursor.rowcount == 1
+        except Exception as e:
+            # Prefer a possible duplicate over losing the attachment
+            logger.error(f"Failed to claim hash {file_hash}: {e}")
+            return True
+
+    def release_hash(self, file_hash: str, any_owner: bool = False):
+        """
+        Drop a hash claim, e.g. after the claimed document failed to store or was rolled back
+
+        Args:
+            file_hash: SHA256 hash of the attachment
+            any_owner: Also drop a claim held by another worker (crash recovery of its journal)
+        """
+        try:
+            if any_owner:
+                self.connection.execute('DELETE FROM claimed_hashes WHERE sha256 = ?', (file_hash,))
+            else:
+                self.connection.execute(
+                    'DELETE FROM claimed_hashes WHERE sha256 = ? AND owner = ?', (file_hash, self.worker_id)
+                )
+        except Exception as e:
+            logger.error(f"Failed to release hash {file_hash}: {e}")
+
+    def is_worker_alive(self, worker_id: str) -> bool:
+        """
+        Check whether a worker has sent a heartbeat within the lease TTL
+
+        Args:
+            worker_id: Identifier of the worker
+
+        Returns:
+            True if the worker is still running
+        """
+        try:
+            row = self.connection.execute(
+                'SELECT last_seen FROM workers WHERE worker_id = ?', (worker_id,)
+            ).fetchone()
+            return row is not None and row[0] > time.time() - self.lease_ttl
+        except Exception as e:
+            # Treat an unreadable store as alive so its journal is left alone
+            logger.error(f"Failed to check worker {worker_id}: {e}")
+            return True
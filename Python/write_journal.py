@@ -0,0 +1,362 @@
+"""
+Write Journal Module
+Write-ahead journal for the attachment write path with group commit and crash recovery
+"""
+import os
+import json
+import time
+import logging
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class JournalEntry:
+    """
+    One attachment moving through the hash -> write -> rename -> flag stages
+    """
+
+    def __init__(self, journal: 'WriteJournal', entry_id: int, file_hash: str):
+        """
+        Initialize journal entry
+
+        Args:
+            journal: Journal the entry belongs to
+            entry_id: Sequence number within the journal
+            file_hash: SHA256 hash of the attachment
+        """
+        self.journal = journal
+        self.entry_id = entry_id
+        self.file_hash = file_hash
+        self.paths: List[Path] = []
+        self.publish: Optional[dict] = None
+
+    def record_write(self, path: Path):
+        """
+        Record the file the attachment is being written to
+        Called after the name is reserved and before any data is written
+
+        Args:
+            path: Path of the saved attachment
+        """
+        self.paths.append(path)
+        self.journal._append({'op': 'write', 'id': self.entry_id, 'path': str(path)})
+
+    def record_rename(self, path: Path):
+        """
+        Record the final name the attachment is being moved to
+        Called after the name is reserved and before the move
+
+        Args:
+            path: Final path of the document
+        """
+        self.paths.append(path)
+        self.journal._append({'op': 'rename', 'id': self.entry_id, 'path': str(path)})
+
+    def record_publish(self, details: dict):
+        """
+        Record what to tell the catalog and indexes once the entry is committed
+        The record precedes the commit record, so recovery can publish it again if the
+        run stops between the commit and the publish
+
+        Args:
+            details: JSON-serializable description passed to the journal's on_publish
+        """
+        self.publish = details
+        self.journal._append({'op': 'publish', 'id': self.entry_id, 'details': details})
+
+
+class WriteJournal:
+    """
+    Append-only journal of in-flight attachments
+
+    Entries are written without fsync. A group commit fsyncs the stored documents and their
+    folders for every finished entry at once, then writes and fsyncs a commit record, so the
+    cost of an fsync is paid once per batch instead of once per file. Processed hashes are
+    persisted, documents published and message flags set only after the commit; a
+    'published' record follows once the publish callbacks have run. At startup, entries
+    without a commit record are rolled back (their files are removed, so the still-unread
+    message is downloaded again), the hashes of committed entries are persisted again and
+    committed entries without a 'published' record are published again, in case the run
+    stopped before doing so.
+    """
+
+    def __init__(self, journal_dir: Path, worker_id: str,
+                 on_durable: Optional[Callable[[List[str]], None]] = None,
+                 on_publish: Optional[Callable[[dict], None]] = None,
+                 batch_size: int = 20, max_delay_ms: int = 1000, fsync: bool = True):
+        """
+        Open the journal for this worker
+
+        Args:
+            journal_dir: Folder holding one journal per worker
+            worker_id: Identifier of this bot instance (journal file name)
+            on_durable: Called after each commit with the hashes that became durable
+            on_publish: Called after each commit with the details of every committed entry
+                that recorded some (see JournalEntry.record_publish); must be idempotent,
+                since recovery may repeat it
+            batch_size: Finished documents that trigger a commit
+            max_delay_ms: Age of the oldest finished document that triggers a commit
+            fsync: Flush files, folders and the journal to stable storage on commit
+        """
+        self.journal_dir = journal_dir
+        self.journal_dir.mkdir(parents=True, exist_ok=True)
+        self.path = journal_dir / f"{worker_id}.log"
+        self.on_durable = on_durable
+        self.on_publish = on_publish
+        self.batch_size = batch_size
+        self.max_delay = max_delay_ms / 1000
+        self.fsync = fsync
+
+        self._file = open(self.path, 'a', encoding='utf-8')
+        self._next_id = 1
+        self._open: Dict[int, JournalEntry] = {}
+        self._finished: List[JournalEntry] = []
+        self._deferred: List[Callable[[], None]] = []
+        self._first_finished_at = 0.0
+        self._commit_failed = False
+        self.commits = 0
+
+    def _append(self, record: dict):
+        """Append a record to the journal (buffered, not fsynced)"""
+        self._file.write(json.dumps(record) + '\n')
+        self._file.flush()
+
+    def begin(self, file_hash: str, uid: str, filename: str) -> JournalEntry:
+        """
+        Start journaling an attachment
+
+        Args:
+            file_hash: SHA256 hash of the attachment
+            uid: UID of the message it came from
+            filename: Original attachment filename
+
+        Returns:
+            Journal entry to pass through the write and rename stages
+        """
+        entry = JournalEntry(self, self._next_id, file_hash)
+        self._next_id += 1
+        self._open[entry.entry_id] = entry
+        self._append({'op': 'begin', 'id': entry.entry_id, 'hash': file_hash, 'uid': uid, 'name': filename})
+        return entry
+
+    def finish(self, entry: JournalEntry):
+        """
+        Mark an entry as stored; it becomes durable at the next commit
+
+        Args:
+            entry: Entry whose document reached its final path
+        """
+        self._open.pop(entry.entry_id, None)
+        if not self._finished:
+            self._first_finished_at = time.monotonic()
+        self._finished.append(entry)
+
+    def abort(self, entry: JournalEntry):
+        """
+        Drop an entry that failed to store; its files are left as they are
+
+        Args:
+            entry: Entry to drop
+        """
+        self._open.pop(entry.entry_id, None)
+        self._append({'op': 'abort', 'id': entry.entry_id})
+
+    def defer(self, callback: Callable[[], None]):
+        """
+        Run a callback after the next commit (e.g. flagging the message as read)
+
+        Args:
+            callback: Function to call once the documents finished so far are durable
+        """
+        self._deferred.append(callback)
+
+    def commit_if_due(self):
+        """Commit if the batch is full or the oldest finished document has waited long enough"""
+        if len(self._finished) >= self.batch_size:
+            self.commit()
+        elif self._finished and time.monotonic() - self._first_finished_at >= self.max_delay:
+            self.commit()
+
+    def commit(self):
+        """Make all finished entries durable, then publish them and run deferred callbacks"""
+        entries, self._finished = self._finished, []
+        callbacks, self._deferred = self._deferred, []
+
+        if entries:
+            try:
+                if self.fsync:
+                    folders = set()
+                    for entry in entries:
+                        path = entry.paths[-1] if entry.paths else None
+                        if path and path.exists():
+                            self._fsync_file(path)
+                            folders.add(path.parent)
+                    for folder in folders:
+                        self._fsync_folder(folder)
+
+                self._append({'op': 'commit', 'ids': [entry.entry_id for entry in entries]})
+                if self.fsync:
+                    os.fsync(self._file.fileno())
+                self.commits += 1
+                logger.debug(f"Journal commit of {len(entries)} document(s)")
+
+                if self.on_durable:
+                    self.on_durable([entry.file_hash for entry in entries])
+            except Exception as e:
+                # The journal is kept, so the next start rolls these entries back or
+                # finishes persisting them; the messages stay unread until then
+                logger.error(f"Journal commit failed for {len(entries)} document(s): {e}")
+                self._commit_failed = True
+                return
+
+            published = [entry for entry in entries if entry.publish is not None]
+            if published and self.on_publish:
+                for entry in published:
+                    self._publish(entry.publish)
+                self._append({'op': 'published', 'ids': [entry.entry_id for entry in published]})
+
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception as e:
+                logger.error(f"Deferred journal callback failed: {e}")
+
+        # Nothing in flight: everything in the journal is committed or aborted
+        # (after a failed commit the records are kept for recovery)
+        if not self._open and not self._finished and not self._commit_failed:
+            self._file.seek(0)
+            self._file.truncate()
+
+    def _publish(self, details: dict):
+        """Run on_publish for one entry; a failure is logged and does not stop the others"""
+        try:
+            self.on_publish(details)
+        except Exception as e:
+            logger.error(f"Failed to publish {details.get('path')}: {e}")
+
+    @staticmethod
+    def _fsync_file(path: Path):
+        """Flush a file's data to stable storage"""
+        # Opened for update because Windows only flushes handles with write access
+        with open(path, 'r+b') as f:
+            os.fsync(f.fileno())
+
+    @staticmethod
+    def _fsync_folder(folder: Path):
+        """Flush a folder's entries (new names) to stable storage; POSIX only"""
+        if os.name != 'posix':
+            return
+        fd = os.open(folder, os.O_RDONLY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+    def recover(self, is_alive: Optional[Callable[[str], bool]] = None,
+                on_rollback: Optional[Callable[[str, List[Path]], None]] = None) -> int:
+        """
+        Finish or roll back the entries left by crashed runs
+        Committed entries are made processed and published again; the rest are rolled back.
+        Covers this worker's journal and those of other workers that are no longer alive
+
+        Args:
+            is_alive: Optional check whether another worker is still running
+            on_rollback: Called with (hash, paths) for each rolled-back entry, after its
+                files are removed, so catalogs and claims can be cleaned up
+
+        Returns:
+            Number of entries rolled back
+        """
+        rolled_back = 0
+        for journal_path in sorted(self.journal_dir.glob('*.log')):
+            if journal_path != self.path and is_alive and is_alive(journal_path.stem):
+                continue
+            try:
+                entries, committed_hashes, unpublished = self._read_journal(journal_path)
+                if committed_hashes and self.on_durable:
+                    self.on_durable(committed_hashes)
+                if self.on_publish:
+                    for details in unpublished:
+                        self._publish(details)
+                    if unpublished:
+                        logger.info(f"Journal recovery published {len(unpublished)} committed document(s)")
+
+                for file_hash, paths in entries:
+                    for path in paths:
+                        if path.exists():
+                            path.unlink()
+                            logger.warning(f"Removed uncommitted document: {path}")
+                    if on_rollback:
+                        on_rollback(file_hash, paths)
+                rolled_back += len(entries)
+
+                if journal_path == self.path:
+                    self._file.seek(0)
+                    self._file.truncate()
+                else:
+                    journal_path.unlink()
+            except Exception as e:
+                logger.error(f"Failed to recover journal {journal_path}: {e}")
+
+        if rolled_back:
+            logger.info(f"Journal recovery rolled back {rolled_back} document(s); "
+                        f"their emails will be downloaded again")
+        return rolled_back
+
+    @staticmethod
+    def _read_journal(journal_path: Path) -> tuple:
+        """
+        Read a journal
+
+        Args:
+            journal_path: Journal file
+
+        Returns:
+            Tuple of (list of (hash, paths) for entries neither committed nor aborted,
+            list of committed hashes, list of publish details of committed entries
+            that were not published)
+        """
+        entries = {}
+        committed_hashes = []
+        details = {}
+        unpublished = {}
+        with open(journal_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    # Torn write at the end of the journal
+                    continue
+                op = record.get('op')
+                if op == 'begin':
+                    entries[record['id']] = (record['hash'], [])
+                elif op in ('write', 'rename') and record['id'] in entries:
+                    entries[record['id']][1].append(Path(record['path']))
+                elif op == 'publish' and record['id'] in entries:
+                    details[record['id']] = record['details']
+                elif op == 'abort':
+                    entries.pop(record['id'], None)
+                    details.pop(record['id'], None)
+                elif op == 'commit':
+                    for entry_id in record['ids']:
+                        entry = entries.pop(entry_id, None)
+                        if entry:
+                            committed_hashes.append(entry[0])
+                        if entry_id in details:
+                            unpublished[entry_id] = details.pop(entry_id)
+                elif op == 'published':
+                    for entry_id in record['ids']:
+                        unpublished.pop(entry_id, None)
+        return list(entries.values()), committed_hashes, list(unpublished.values())
+
+    def close(self):
+        """Commit outstanding entries and close the journal; an empty journal is removed"""
+        try:
+            self.commit()
+            self._file.close()
+            if not self._open and not self._commit_failed:
+                self.path.unlink(missing_ok=True)
+        except Exception as e:
+            logger.warning(f"Error closing write journal: {e}")